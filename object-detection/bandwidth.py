@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Per-client throughput estimation and the JPEG quality ladder for /ws frames
+"""
+from collections import namedtuple
+
+import cv2
+
+Rung = namedtuple("Rung", "name scale quality")
+
+# Best first. Only rungs with at least one subscriber get encoded.
+JPEG_LADDER = (
+    Rung("full", 1.0, 85),
+    Rung("half", 0.5, 70),
+    Rung("quarter", 0.25, 50),
+)
+
+TARGET_FPS = 30.0       # broadcast_worker cadence
+HEADROOM = 0.8          # use at most this share of the estimated throughput
+EWMA_ALPHA = 0.3
+MIN_SEND_TIME = 0.0005  # seconds; sends faster than this did not block and say little about the link
+SKIP_PENALTY = 0.7      # throughput scale when a frame is skipped because the last one is still sending
+PROBE_GAIN = 1.02       # throughput scale per non-blocking send, so a recovered link climbs back gradually
+
+
+def encode_rung(frame_bgr, rung):
+    """JPEG bytes for one ladder rung. Runs in the encoder thread pool."""
+    if rung.scale != 1.0:
+        height, width = frame_bgr.shape[:2]
+        size = (max(1, int(width * rung.scale)), max(1, int(height * rung.scale)))
+        frame_bgr = cv2.resize(frame_bgr, size, interpolation=cv2.INTER_AREA)
+    _, buffer = cv2.imencode('.jpg', frame_bgr, [int(cv2.IMWRITE_JPEG_QUALITY), rung.quality])
+    return buffer.tobytes()
+
+
+class ClientLink:
+    """Throughput estimate and current ladder rung for one WebSocket client"""
+
+    def __init__(self):
+        self.throughput = None  # bytes/second, None until the first send completes
+        self.rung = JPEG_LADDER[0]
+        self.send_task = None
+        self.frames_sent = 0
+        self.frames_skipped = 0
+
+    @property
+    def busy(self):
+        """Still sending the previous frame"""
+        return self.send_task is not None and not self.send_task.done()
+
+    def record_send(self, nbytes, elapsed):
+        """Fold one completed send into the throughput estimate"""
+        self.frames_sent += 1
+        if elapsed < MIN_SEND_TIME:
+            # Went straight into the socket buffer: no rate to measure, only a hint of spare capacity
+            if self.throughput is not None:
+                self.throughput *= PROBE_GAIN
+            return
+        rate = nbytes / elapsed
+        if self.throughput is None:
+            self.throughput = rate
+        else:
+            self.throughput += EWMA_ALPHA * (rate - self.throughput)
+
+    def record_skip(self):
+        self.frames_skipped += 1
+        if self.throughput is not None:
+            self.throughput *= SKIP_PENALTY
+
+    def choose_rung(self, rung_sizes):
+        """Best rung whose recent frame size fits the link at TARGET_FPS"""
+        if self.throughput is None:
+            return self.rung
+        budget = self.throughput * HEADROOM / TARGET_FPS
+        for rung in JPEG_LADDER:
+            size = rung_sizes.get(rung.name)
+            if size is None or size <= budget:
+                self.rung = rung
+                return rung
+        self.rung = JPEG_LADDER[-1]
+        return self.rung
+
+    def stats(self):
+        return {
+            "rung": self.rung.name,
+            "throughput_kbps": None if self.throughput is None else round(self.throughput * 8 / 1000, 1),
+            "frames_sent": self.frames_sent,
+            "frames_skipped": self.frames_skipped,
+        }
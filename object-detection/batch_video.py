@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Headless batch processing of video files.
+
+Decodes on a background thread, runs the person detector over batches of
+frames as fast as the CPU allows, optionally over several worker processes
+that each take one segment of the file, and writes all detections to a
+columnar file (.npz, or .parquet when pyarrow is installed).
+"""
+import argparse
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+
+import cv2
+import numpy as np
+import torch
+from ultralytics import YOLO
+
+import preprocess
+from quantize import resolve_model
+
+# Configuration (same as webrtc_demo.py)
+MODEL_PATH = "yolov8n.pt"
+CONF_BASE = 0.75
+IOU = 0.30
+device = "cpu"
+
+COLUMNS = ("frame_index", "confidence", "x1", "y1", "x2", "y2")
+
+
+def decode_frames(video_path, start, end, out_q, stop):
+    """Decoder thread: push (frame_index, frame_bgr) for [start, end), then None"""
+    cap = cv2.VideoCapture(video_path)
+    try:
+        if start > 0:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        idx = start
+        while idx < end and not stop.is_set():
+            ret, frame = cap.read()
+            if not ret:
+                break
+            out_q.put((idx, frame))
+            idx += 1
+    finally:
+        cap.release()
+        out_q.put(None)
+
+
+def process_segment(video_path, start, end, batch_size=8, annotate_path=None, threads=None,
+                    model_path=MODEL_PATH):
+    """Run detection over frames [start, end) and return column arrays"""
+    if threads:
+        torch.set_num_threads(threads)
+
+    model = YOLO(model_path, task="detect")
+
+    frames_q = queue.Queue(maxsize=batch_size * 4)
+    stop = threading.Event()
+    decoder = threading.Thread(
+        target=decode_frames, args=(video_path, start, end, frames_q, stop), daemon=True
+    )
+    decoder.start()
+
+    columns = {name: [] for name in COLUMNS}
+    writer = None
+    frames_done = 0
+
+    def run_batch(batch):
+        nonlocal writer
+        # Every frame of a file has the same resolution, so one letterbox shape per batch
+        frames_rgb = [cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) for _, frame in batch]
+        shape = preprocess.shape_for(frames_rgb[0])
+        inputs = [preprocess.model_input(frame_rgb, shape)[0] for frame_rgb in frames_rgb]
+        results = model.predict(
+            source=inputs,
+            imgsz=[shape.input_h, shape.input_w],
+            conf=CONF_BASE,
+            iou=IOU,
+            augment=False,
+            agnostic_nms=False,
+            classes=[0],
+            device=device,
+            verbose=False
+        )
+        for (idx, _), frame_rgb, res in zip(batch, frames_rgb, results):
+            if res.boxes is not None and len(res.boxes) > 0:
+                # Map boxes from the letterboxed model input back to source pixels
+                xyxy = preprocess.boxes_to_source(res.boxes.xyxy.cpu().numpy(), shape)
+                conf = res.boxes.conf.cpu().numpy()
+                columns["frame_index"].append(np.full(len(conf), idx, dtype=np.int64))
+                columns["confidence"].append(conf.astype(np.float32))
+                for i, name in enumerate(("x1", "y1", "x2", "y2")):
+                    columns[name].append(xyxy[:, i].astype(np.float32))
+
+            if annotate_path:
+                vis = res.plot(img=preprocess.letterbox(frame_rgb, shape))
+                vis_bgr = cv2.cvtColor(preprocess.unletterbox(vis, shape), cv2.COLOR_RGB2BGR)
+                if writer is None:
+                    fourcc = cv2.VideoWriter_fourcc(*"mp4v")
+                    writer = cv2.VideoWriter(
+                        annotate_path, fourcc, source_fps(video_path), (shape.width, shape.height)
+                    )
+                writer.write(vis_bgr)
+
+    try:
+        batch = []
+        while True:
+            item = frames_q.get()
+            if item is None:
+                break
+            batch.append(item)
+            if len(batch) == batch_size:
+                run_batch(batch)
+                frames_done += len(batch)
+                batch = []
+        if batch:
+            run_batch(batch)
+            frames_done += len(batch)
+    finally:
+        stop.set()
+        if writer is not None:
+            writer.release()
+
+    arrays = {
+        name: np.concatenate(parts) if parts else np.empty(0, dtype=np.int64 if name == "frame_index" else np.float32)
+        for name, parts in columns.items()
+    }
+    return arrays, frames_done
+
+
+def _segment_worker(args):
+    return process_segment(*args)
+
+
+def source_fps(video_path):
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    cap.release()
+    return fps
+
+
+def video_info(video_path):
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise RuntimeError(f"Failed to open video file: {video_path}")
+    info = {
+        "frames": int(cap.get(cv2.CAP_PROP_FRAME_COUNT)),
+        "fps": cap.get(cv2.CAP_PROP_FPS) or 30.0,
+        "width": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        "height": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+    }
+    cap.release()
+    return info
+
+
+def concat_videos(parts, output_path, fps, size):
+    """Join per-segment annotated videos in order"""
+    writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, size)
+    for part in parts:
+        # A segment that decoded no frames (FRAME_COUNT overestimates) never created its writer
+        if not os.path.exists(part):
+            continue
+        cap = cv2.VideoCapture(part)
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            writer.write(frame)
+        cap.release()
+        os.remove(part)
+    writer.release()
+
+
+def save_detections(path, columns, info, frames_done):
+    """Write detections as columns plus per-frame offsets into them"""
+    frame_index = columns["frame_index"]
+    # frame_offsets[i]:frame_offsets[i+1] are the rows of frame i
+    counts = np.bincount(frame_index, minlength=frames_done) if len(frame_index) else np.zeros(frames_done, dtype=np.int64)
+    frame_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+    if path.endswith(".parquet"):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Writing .parquet needs pyarrow (pip install pyarrow), or use a .npz output")
+        table = pa.table({name: columns[name] for name in COLUMNS})
+        table = table.replace_schema_metadata({
+            key: str(value) for key, value in dict(info, frames_processed=frames_done).items()
+        })
+        pq.write_table(table, path)
+    else:
+        np.savez_compressed(
+            path,
+            frame_offsets=frame_offsets,
+            fps=info["fps"],
+            width=info["width"],
+            height=info["height"],
+            **columns
+        )
+
+
+def process_video(video_path, output_path, annotate_path=None, workers=1, batch_size=8,
+                  quantize=None, calib_dir=None):
+    """Run the detector over a whole video file and save its detections"""
+    info = video_info(video_path)
+    # Export the INT8 model here once, not in every worker
+    model_path = resolve_model(MODEL_PATH, quantize, calib_dir)
+    total = info["frames"]
+    workers = max(1, min(workers, total)) if total > 0 else 1
+    threads = max(1, (os.cpu_count() or 1) // workers)
+
+    # One contiguous segment of the file per worker
+    bounds = np.linspace(0, total, workers + 1).astype(int) if total > 0 else [0, 2 ** 62]
+    parts = []
+    jobs = []
+    for i in range(workers):
+        part = None
+        if annotate_path:
+            part = annotate_path if workers == 1 else f"{annotate_path}.part{i}.mp4"
+            parts.append(part)
+        jobs.append((video_path, int(bounds[i]), int(bounds[i + 1]), batch_size, part, threads, model_path))
+
+    print(f"[batch] {video_path}: {total} frames {info['width']}x{info['height']}, "
+          f"{workers} worker(s), batch {batch_size}, model {model_path}")
+    start_time = time.time()
+
+    if workers == 1:
+        results = [_segment_worker(jobs[0])]
+    else:
+        with mp.get_context("spawn").Pool(workers) as pool:
+            results = pool.map(_segment_worker, jobs)
+
+    columns = {
+        name: np.concatenate([arrays[name] for arrays, _ in results]) for name in COLUMNS
+    }
+    frames_done = sum(done for _, done in results)
+
+    save_detections(output_path, columns, info, frames_done)
+    if annotate_path and workers > 1:
+        concat_videos(parts, annotate_path, info["fps"], (info["width"], info["height"]))
+
+    elapsed = time.time() - start_time
+    fps = frames_done / elapsed if elapsed > 0 else 0
+    print(f"[batch] {frames_done} frames, {len(columns['frame_index'])} detections "
+          f"in {elapsed:.1f}s ({fps:.1f} FPS) -> {output_path}")
+    return fps
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Headless batch person detection over a video file")
+    parser.add_argument("video", help="input video file")
+    parser.add_argument("-o", "--output", default=None,
+                        help="detections file, .npz or .parquet (default: <video>.detections.npz)")
+    parser.add_argument("--annotate", default=None, help="also write an annotated video here")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes over file segments")
+    parser.add_argument("--batch-size", type=int, default=8, help="frames per model.predict call")
+    parser.add_argument("--int8", choices=("dynamic", "static"), default=None,
+                        help="use the INT8 quantized model (exported on first use)")
+    parser.add_argument("--calib-dir", default=None, help="calibration image folder for --int8 static")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    output = args.output or os.path.splitext(args.video)[0] + ".detections.npz"
+    process_video(args.video, output, args.annotate, args.workers, args.batch_size, args.int8, args.calib_dir)
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Video source opening and the shared-memory capture process.
+
+Kept free of model and server imports: on Windows and macOS the capture
+process is spawned and re-imports the module its target lives in.
+"""
+import multiprocessing as mp
+import os
+import time
+
+import cv2
+
+from frame_ring import SharedFrameRing, RingCapture
+
+FIRST_FRAME_TIMEOUT = 30.0  # seconds; camera start-up in a fresh process can be slow
+
+
+def open_camera(preferred_index=0):
+    """Try to open camera with different backends"""
+    backends = [cv2.CAP_MSMF, cv2.CAP_DSHOW, cv2.CAP_ANY]
+    tried = set()
+    for backend in backends:
+        for idx in [preferred_index]:
+            key = (backend, idx)
+            if key in tried:
+                continue
+            tried.add(key)
+            cap = cv2.VideoCapture(idx, backend)
+            if cap.isOpened():
+                cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
+                cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
+                print(f"[cam] opened index={idx} backend={backend}")
+                return cap
+            cap.release()
+    return None
+
+
+def open_source(video_source):
+    """Open a video file if it exists, otherwise the default camera"""
+    if video_source and os.path.exists(video_source):
+        cap = cv2.VideoCapture(video_source)
+        if not cap.isOpened():
+            raise RuntimeError(f"Failed to open video file: {video_source}")
+        print(f"[vid] playing file: {video_source}")
+        return cap
+
+    cap = open_camera(preferred_index=0)
+    if cap is None:
+        raise RuntimeError(
+            "No camera opened. Close Teams/Zoom/OBS/Camera app and try again.\n"
+            "Or run with a video file:  python webrtc_demo.py path\\to\\video.mp4"
+        )
+    return cap
+
+
+def capture_process(video_source, ring_spec, stop):
+    """Capture side: read frames and write them once into the shared ring until stop is set"""
+    ring = SharedFrameRing.attach(**ring_spec)
+    try:
+        cap = open_source(video_source)
+    except RuntimeError:
+        ring.close_stream()
+        ring.close()
+        raise
+    height, width = ring.shape[:2]
+    try:
+        while not stop.is_set():
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if frame.shape != ring.shape:
+                frame = cv2.resize(frame, (width, height))
+            ring.write(frame)
+    finally:
+        ring.close_stream()
+        cap.release()
+        ring.close()
+
+
+class ShmCapture:
+    """Capture process plus its ring; stop() shuts the child down cleanly"""
+
+    def __init__(self, ring, proc, stop_event):
+        self.ring = ring
+        self.proc = proc
+        self.stop_event = stop_event
+
+    def stop(self, timeout=2.0):
+        # Unpin our slot first: a terminated child could die holding the ring lock
+        self.ring.release()
+        self.stop_event.set()
+        self.proc.join(timeout=timeout)
+        if self.proc.is_alive():
+            self.proc.terminate()
+            self.proc.join(timeout=timeout)
+
+
+def start_shm_capture(video_source, slots, first_frame_timeout=FIRST_FRAME_TIMEOUT):
+    """Start capture in its own process; returns (RingCapture, ShmCapture) once the first frame is in"""
+    # Probe the frame size so the ring slots can be allocated up front
+    probe = open_source(video_source)
+    ret, frame = probe.read()
+    probe.release()
+    if not ret:
+        raise RuntimeError("Could not read a first frame from the video source")
+
+    ring = SharedFrameRing(frame.shape, slots=slots)
+    stop_event = mp.Event()
+    proc = mp.Process(target=capture_process, args=(video_source, ring.spec(), stop_event), daemon=True)
+    proc.start()
+    print(f"[shm] capture process pid={proc.pid}, ring {ring.name}: {slots} x {frame.shape}")
+    handle = ShmCapture(ring, proc, stop_event)
+
+    # RingCapture gives up after a couple of seconds without frames; don't start it before the child is up
+    deadline = time.monotonic() + first_frame_timeout
+    while ring.stats()["frames_written"] == 0:
+        if not proc.is_alive() or ring.closed or time.monotonic() >= deadline:
+            handle.stop()
+            ring.close()
+            raise RuntimeError("Capture process did not deliver a first frame")
+        time.sleep(0.01)
+    return RingCapture(ring), handle
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Shared-memory frame ring buffer for passing frames between processes
+"""
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import time
+
+import numpy as np
+
+# Header layout (int64 fields at the start of the shared block)
+HDR_LATEST_SEQ = 0     # sequence number of the newest complete frame (-1 = none)
+HDR_WRITTEN = 1        # frames written by the producer
+HDR_READ = 2           # frames handed out to the consumer
+HDR_OVERWRITTEN = 3    # frames replaced by a newer one before anyone read them
+HDR_CLOSED = 4         # producer finished (end of stream)
+HDR_FIELDS = 5
+
+SLOT_FREE = -1         # slot has never held a frame
+SLOT_WRITING = -2      # slot is being written right now
+
+
+class SharedFrameRing:
+    """Fixed-size frame slots in one shared memory block.
+
+    The producer calls write() once per frame, the consumer calls
+    read_latest() to get a zero-copy NumPy view of the newest frame.
+    A slot handed to the consumer stays pinned until release(), and the
+    writer never reuses a pinned slot, so views are never torn.
+    """
+
+    def __init__(self, shape, slots=4, name=None, lock=None, create=True):
+        if slots < 3:
+            raise ValueError("SharedFrameRing needs at least 3 slots")
+        self.shape = tuple(shape)
+        self.slots = slots
+        self.lock = lock if lock is not None else mp.Lock()
+        self.frame_bytes = int(np.prod(self.shape))
+
+        # Header + per-slot sequence numbers + per-slot pin counts, padded to 64 bytes
+        meta_bytes = (HDR_FIELDS + 2 * slots) * 8
+        self.data_offset = (meta_bytes + 63) // 64 * 64
+        total = self.data_offset + slots * self.frame_bytes
+
+        if create:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=total)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.owner = create
+
+        meta = np.ndarray((HDR_FIELDS + 2 * slots,), dtype=np.int64, buffer=self.shm.buf)
+        self.header = meta[:HDR_FIELDS]
+        self.slot_seq = meta[HDR_FIELDS:HDR_FIELDS + slots]
+        self.slot_pins = meta[HDR_FIELDS + slots:]
+        self.frames = np.ndarray(
+            (slots,) + self.shape, dtype=np.uint8,
+            buffer=self.shm.buf, offset=self.data_offset
+        )
+
+        if create:
+            self.header[:] = 0
+            self.header[HDR_LATEST_SEQ] = -1
+            self.slot_seq[:] = SLOT_FREE
+            self.slot_pins[:] = 0
+
+        self._next_slot = 0
+        self._last_read_seq = -1
+        self._pinned = None
+
+    @classmethod
+    def attach(cls, name, shape, slots, lock):
+        """Attach to a ring created by another process"""
+        return cls(shape, slots=slots, name=name, lock=lock, create=False)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def spec(self):
+        """Arguments a child process needs to attach()"""
+        return {"name": self.name, "shape": self.shape, "slots": self.slots, "lock": self.lock}
+
+    # ---------------- producer side ----------------
+
+    def write(self, frame):
+        """Copy a frame into the next free slot and publish it. Returns its sequence number."""
+        if frame.shape != self.shape or frame.dtype != np.uint8:
+            raise ValueError(f"Frame must be uint8 {self.shape}, got {frame.dtype} {frame.shape}")
+
+        with self.lock:
+            # Skip over the slot the consumer is holding and the newest published frame
+            latest = self.header[HDR_LATEST_SEQ]
+            slot = self._next_slot
+            for _ in range(self.slots):
+                if self.slot_pins[slot] == 0 and (latest < 0 or self.slot_seq[slot] != latest):
+                    break
+                slot = (slot + 1) % self.slots
+            else:
+                raise RuntimeError("All ring slots are pinned by readers")
+            self.slot_seq[slot] = SLOT_WRITING
+
+        # The only copy of the frame: straight into shared memory, outside the lock
+        np.copyto(self.frames[slot], frame)
+
+        with self.lock:
+            seq = int(self.header[HDR_WRITTEN])
+            self.slot_seq[slot] = seq
+            self.header[HDR_LATEST_SEQ] = seq
+            self.header[HDR_WRITTEN] = seq + 1
+
+        self._next_slot = (slot + 1) % self.slots
+        return seq
+
+    def close_stream(self):
+        """Tell readers no more frames are coming"""
+        with self.lock:
+            self.header[HDR_CLOSED] = 1
+
+    # ---------------- consumer side ----------------
+
+    def read_latest(self, after_seq=None):
+        """Pin and return (seq, view) of the newest frame, or (None, None).
+
+        If after_seq is given, only frames newer than it are returned.
+        The view stays valid until release() or the next read_latest().
+        """
+        self.release()
+        with self.lock:
+            seq = int(self.header[HDR_LATEST_SEQ])
+            if seq < 0 or (after_seq is not None and seq <= after_seq):
+                return None, None
+            slot = int(np.flatnonzero(self.slot_seq == seq)[0])
+            self.slot_pins[slot] += 1
+            self.header[HDR_READ] += 1
+            # From _last_read_seq = -1 this also counts frames replaced before the first read
+            if seq > self._last_read_seq + 1:
+                self.header[HDR_OVERWRITTEN] += seq - self._last_read_seq - 1
+        self._last_read_seq = seq
+        self._pinned = slot
+        return seq, self.frames[slot]
+
+    def wait_latest(self, timeout=1.0, poll_interval=0.001):
+        """Block until a frame newer than the last one read arrives.
+
+        Returns (seq, view), or (None, None) on timeout or end of stream.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            seq, frame = self.read_latest(after_seq=self._last_read_seq)
+            if frame is not None:
+                return seq, frame
+            if self.closed or time.monotonic() >= deadline:
+                return None, None
+            time.sleep(poll_interval)
+
+    def release(self):
+        """Unpin the slot returned by the last read"""
+        if self._pinned is None:
+            return
+        with self.lock:
+            self.slot_pins[self._pinned] -= 1
+        self._pinned = None
+
+    @property
+    def closed(self):
+        return bool(self.header[HDR_CLOSED])
+
+    def stats(self):
+        """Counters shared by both sides"""
+        with self.lock:
+            return {
+                "slots": self.slots,
+                "latest_seq": int(self.header[HDR_LATEST_SEQ]),
+                "frames_written": int(self.header[HDR_WRITTEN]),
+                "frames_read": int(self.header[HDR_READ]),
+                "frames_overwritten": int(self.header[HDR_OVERWRITTEN]),
+            }
+
+    def close(self):
+        """Detach from the shared block, and free it if we created it"""
+        self.release()
+        # Drop our NumPy views before closing the mapping
+        self.header = self.slot_seq = self.slot_pins = self.frames = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # A caller still holds a frame view; the mapping goes away with the process
+            pass
+        if self.owner:
+            self.shm.unlink()
+
+
+class RingCapture:
+    """cv2.VideoCapture-like reader over a SharedFrameRing.
+
+    read() returns a zero-copy view that is valid until the next read().
+    """
+
+    def __init__(self, ring, timeout=2.0):
+        self.ring = ring
+        self.timeout = timeout
+
+    def isOpened(self):
+        return not self.ring.closed
+
+    def read(self):
+        _, frame = self.ring.wait_latest(timeout=self.timeout)
+        return frame is not None, frame
+
+    def release(self):
+        self.ring.close()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Per-connection state for inference over /ws.
+
+Clients send images as binary WebSocket messages:
+  [request id: uint32, big-endian][JPEG/PNG bytes]
+or as text {"type": "infer", "id": 7, "image": "<base64>"}, and get
+{"type": "result", "id": 7, "status": 200, ...} back on the same socket.
+
+Up to max_in_flight requests run at once per connection. Past that,
+requests are rejected with status 429, or in live mode only the newest
+waiting request is kept and the one it replaces is answered with status
+"dropped" (stale frames are worth nothing to a live source).
+"""
+import math
+import struct
+
+REQUEST_ID = struct.Struct(">I")
+DEFAULT_MAX_IN_FLIGHT = 4
+MAX_IN_FLIGHT_LIMIT = 32
+
+
+def parse_binary_request(data):
+    """(request id, image bytes) from a binary message.
+
+    The id is None if the message is shorter than one; the image is empty
+    if nothing follows the id.
+    """
+    if len(data) < REQUEST_ID.size:
+        return None, b""
+    return REQUEST_ID.unpack_from(data)[0], memoryview(data)[REQUEST_ID.size:]
+
+
+class InferenceChannel:
+    """Flow control for one WebSocket client's inference requests"""
+
+    def __init__(self, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+        self.max_in_flight = max_in_flight
+        self.live = False       # keep only the newest waiting request
+        self.annotate = False   # include the annotated JPEG in results
+        self.deadline_ms = None
+        self.in_flight = 0
+        self.pending = None     # (request id, image data, is_base64), live mode only
+        self.tasks = set()
+        self.completed = 0
+        self.rejected = 0
+        self.dropped = 0
+
+    def configure(self, message):
+        """Apply a {"type": "config", ...} message.
+
+        Returns the waiting request dropped by leaving live mode, if any.
+        """
+        if "annotate" in message:
+            self.annotate = bool(message["annotate"])
+        if "max_in_flight" in message:
+            self.max_in_flight = min(max(int(message["max_in_flight"]), 1), MAX_IN_FLIGHT_LIMIT)
+        if "deadline_ms" in message:
+            deadline_ms = message["deadline_ms"]
+            deadline_ms = None if deadline_ms is None else float(deadline_ms)
+            # NaN/inf budgets would never expire: same as no deadline
+            self.deadline_ms = max(deadline_ms, 0.0) if deadline_ms is not None and math.isfinite(deadline_ms) else None
+        # Last, so a bad value above cannot lose the request taken out of pending
+        dropped = None
+        if "live" in message:
+            self.live = bool(message["live"])
+            if not self.live and self.pending is not None:
+                dropped, self.pending = self.pending, None
+                self.dropped += 1
+        return dropped
+
+    def offer(self, request):
+        """Decide what to do with a new request.
+
+        Returns ("run", request), ("reject", request) or ("queue", replaced);
+        replaced is the pending request the new one displaced, or None.
+        """
+        if self.in_flight < self.max_in_flight:
+            self.in_flight += 1
+            return "run", request
+        if not self.live:
+            self.rejected += 1
+            return "reject", request
+        replaced, self.pending = self.pending, request
+        if replaced is not None:
+            self.dropped += 1
+        return "queue", replaced
+
+    def finish(self):
+        """Mark one request done; returns the pending request to start next, if any"""
+        self.completed += 1
+        if self.pending is not None:
+            request, self.pending = self.pending, None
+            return request
+        self.in_flight -= 1
+        return None
+
+    def stats(self):
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "live": self.live,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "dropped": self.dropped,
+        }
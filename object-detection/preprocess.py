@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Shared model-input preprocessing.
+
+Frames are letterboxed to a stride-aligned rectangle instead of being
+squashed to 640x640: a 1280x720 camera frame becomes a 640x384 input,
+aspect ratio preserved. Boxes predicted on that input are mapped back to
+source pixels with boxes_to_source().
+"""
+from collections import namedtuple
+from functools import lru_cache
+import math
+import struct
+
+import cv2
+import numpy as np
+
+IMG_SIZE = 640
+STRIDE = 32
+PAD_VALUE = 114  # same grey ultralytics pads with
+
+# JPEG start-of-frame markers (carry the image size); excludes DHT (C4), JPG (C8), DAC (CC)
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+REDUCED_DECODE = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+LetterboxShape = namedtuple(
+    "LetterboxShape", "width height scale new_w new_h input_w input_h pad_left pad_top"
+)
+
+
+@lru_cache(maxsize=64)
+def letterbox_shape(width, height, img_size=IMG_SIZE, stride=STRIDE):
+    """Input geometry for a source resolution, cached per resolution"""
+    scale = img_size / max(width, height)
+    new_w = max(1, int(round(width * scale)))
+    new_h = max(1, int(round(height * scale)))
+    input_w = int(math.ceil(new_w / stride) * stride)
+    input_h = int(math.ceil(new_h / stride) * stride)
+    return LetterboxShape(
+        width, height, scale, new_w, new_h, input_w, input_h,
+        (input_w - new_w) // 2, (input_h - new_h) // 2
+    )
+
+
+def shape_for(frame):
+    height, width = frame.shape[:2]
+    return letterbox_shape(width, height)
+
+
+def adjust_brightness(frame_rgb):
+    """Tone down bright frames for the model (exactly like live_patch_attack.py)"""
+    gray = cv2.cvtColor(frame_rgb, cv2.COLOR_RGB2GRAY)
+    if np.mean(gray) > 100:  # Bright lighting detected
+        # Reduce brightness and enhance contrast
+        frame_rgb = cv2.convertScaleAbs(frame_rgb, alpha=0.7, beta=-30)
+        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
+        lab = cv2.cvtColor(frame_rgb, cv2.COLOR_RGB2LAB)
+        lab[:,:,0] = clahe.apply(lab[:,:,0])
+        frame_rgb = cv2.cvtColor(lab, cv2.COLOR_LAB2RGB)
+    return frame_rgb
+
+
+def letterbox(img, shape):
+    """Resize keeping aspect ratio and pad to the stride-aligned input size"""
+    if (img.shape[1], img.shape[0]) != (shape.new_w, shape.new_h):
+        interp = cv2.INTER_AREA if shape.scale < 1 else cv2.INTER_LINEAR
+        img = cv2.resize(img, (shape.new_w, shape.new_h), interpolation=interp)
+    right = shape.input_w - shape.new_w - shape.pad_left
+    bottom = shape.input_h - shape.new_h - shape.pad_top
+    if shape.pad_left or shape.pad_top or right or bottom:
+        img = cv2.copyMakeBorder(
+            img, shape.pad_top, bottom, shape.pad_left, right,
+            cv2.BORDER_CONSTANT, value=(PAD_VALUE, PAD_VALUE, PAD_VALUE)
+        )
+    return np.ascontiguousarray(img)
+
+
+def unletterbox(img, shape):
+    """Crop the padding off a letterboxed image and scale it back to source size"""
+    crop = img[shape.pad_top:shape.pad_top + shape.new_h, shape.pad_left:shape.pad_left + shape.new_w]
+    return cv2.resize(crop, (shape.width, shape.height))
+
+
+def model_input(frame_rgb, shape=None):
+    """Brightness-adjusted, letterboxed uint8 RGB input for model.predict"""
+    shape = shape or shape_for(frame_rgb)
+    return letterbox(adjust_brightness(frame_rgb), shape), shape
+
+
+def boxes_to_source(xyxy, shape):
+    """Map Nx4 xyxy boxes from letterboxed input pixels to source pixels"""
+    xyxy = np.asarray(xyxy, dtype=np.float32).reshape(-1, 4).copy()
+    xyxy[:, [0, 2]] = (xyxy[:, [0, 2]] - shape.pad_left) / shape.scale
+    xyxy[:, [1, 3]] = (xyxy[:, [1, 3]] - shape.pad_top) / shape.scale
+    xyxy[:, [0, 2]] = xyxy[:, [0, 2]].clip(0, shape.width)
+    xyxy[:, [1, 3]] = xyxy[:, [1, 3]].clip(0, shape.height)
+    return xyxy
+
+
+def image_size(data):
+    """(width, height) from a JPEG or PNG header without decoding, or None"""
+    data = memoryview(data)
+    if len(data) >= 24 and bytes(data[:8]) == b"\x89PNG\r\n\x1a\n":
+        return struct.unpack(">II", data[16:24])
+    if len(data) < 4 or bytes(data[:2]) != b"\xff\xd8":
+        return None
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        if marker in JPEG_SOF_MARKERS:
+            height, width = struct.unpack(">HH", data[i + 5:i + 9])
+            return width, height
+        if marker in (0x01, 0xD8) or 0xD0 <= marker <= 0xD7:  # markers without a length
+            i += 2
+            continue
+        i += 2 + struct.unpack(">H", data[i + 2:i + 4])[0]
+    return None
+
+
+def decode_image(data, img_size=IMG_SIZE):
+    """Decode an uploaded image, using the codec's downscaled decode for oversized sources.
+
+    Picks the largest 1/2, 1/4 or 1/8 reduction that still leaves the long
+    side at least img_size, so the model input loses nothing. Returns
+    (frame_bgr, (orig_w, orig_h)), or (None, None) if the data is not an image.
+    """
+    if len(data) == 0:
+        return None, None  # imdecode asserts on an empty buffer
+    buf = np.frombuffer(data, np.uint8)
+    size = image_size(data)
+    flag, factor = cv2.IMREAD_COLOR, 1
+    if size is not None:
+        for f, reduced_flag in REDUCED_DECODE:
+            if max(size) // f >= img_size:
+                flag, factor = reduced_flag, f
+                break
+
+    frame_bgr = cv2.imdecode(buf, flag)
+    if frame_bgr is None:
+        return None, None
+    height, width = frame_bgr.shape[:2]
+    if size is None or factor == 1:
+        return frame_bgr, (width, height)
+
+    # imdecode applies EXIF rotation, so the header size may be transposed
+    orig_w, orig_h = size
+    if (orig_w > orig_h) != (width > height):
+        orig_w, orig_h = orig_h, orig_w
+    return frame_bgr, (orig_w, orig_h)
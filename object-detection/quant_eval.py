@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Accuracy / latency regression harness for the INT8 model.
+
+Runs the fp32 and INT8 models side by side on an image folder and compares
+person detection quality at the server's thresholds. Ground truth comes
+from YOLO-format label files (class cx cy w h, normalized) when present;
+otherwise the fp32 detections at our thresholds are used as the reference.
+Exits with status 1 if the INT8 model degrades more than the allowed bound.
+
+Usage:  python quant_eval.py images/ --int8 yolov8n_int8_static.onnx
+"""
+import argparse
+import multiprocessing as mp
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+from ultralytics import YOLO
+
+import preprocess
+from quantize import MODEL_PATH, export_int8, list_images, resolve_model
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+CONF_BASE = 0.75
+IOU = 0.30
+CONF_FLOOR = 0.001   # keep low-confidence boxes so the full PR curve is available for mAP
+MATCH_IOU = 0.5
+
+
+def box_iou(box, boxes):
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / np.maximum(area + areas - inter, 1e-9)
+
+
+def load_labels(label_path, width, height):
+    """Person boxes from a YOLO label file, in source image pixels"""
+    if not os.path.exists(label_path):
+        return np.zeros((0, 4), dtype=np.float32)
+    rows = np.loadtxt(label_path, ndmin=2)
+    rows = rows[rows[:, 0] == 0] if len(rows) else rows
+    if not len(rows):
+        return np.zeros((0, 4), dtype=np.float32)
+    cx, w = rows[:, 1] * width, rows[:, 3] * width
+    cy, h = rows[:, 2] * height, rows[:, 4] * height
+    return np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1).astype(np.float32)
+
+
+def run_model(model_path, image_paths, warmup=3):
+    """Predict every image; returns (per-image Nx5 source-pixel boxes+conf, latencies, peak RSS MB)"""
+    model = YOLO(model_path, task="detect")
+    inputs = [
+        preprocess.model_input(cv2.cvtColor(cv2.imread(path), cv2.COLOR_BGR2RGB))
+        for path in image_paths
+    ]
+
+    def predict(model_input, shape):
+        return model.predict(
+            source=model_input,
+            imgsz=[shape.input_h, shape.input_w],
+            conf=CONF_FLOOR,
+            iou=IOU,
+            augment=False,
+            agnostic_nms=False,
+            classes=[0],
+            device="cpu",
+            verbose=False
+        )[0]
+
+    for model_input, shape in inputs[:warmup]:
+        predict(model_input, shape)
+
+    preds, latencies = [], []
+    for model_input, shape in inputs:
+        started = time.perf_counter()
+        res = predict(model_input, shape)
+        latencies.append(time.perf_counter() - started)
+        if res.boxes is not None and len(res.boxes) > 0:
+            boxes = np.concatenate([
+                preprocess.boxes_to_source(res.boxes.xyxy.cpu().numpy(), shape),
+                res.boxes.conf.cpu().numpy()[:, None]
+            ], axis=1)
+        else:
+            boxes = np.zeros((0, 5), dtype=np.float32)
+        preds.append(boxes.astype(np.float32))
+
+    return preds, latencies, peak_rss_mb()
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB"""
+    if resource is not None:
+        # ru_maxrss is KB on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    import psutil  # installed with ultralytics
+    info = psutil.Process().memory_info()
+    return getattr(info, "peak_wset", info.rss) / (1024 * 1024)
+
+
+def run_isolated(model_path, image_paths):
+    """run_model in a fresh process so peak memory is per model"""
+    with mp.get_context("spawn").Pool(1) as pool:
+        return pool.apply(run_model, (model_path, image_paths))
+
+
+def evaluate(preds, truths, conf_threshold=CONF_BASE):
+    """mAP@0.5 over the whole PR curve, plus precision/recall at conf_threshold"""
+    n_truth = sum(len(t) for t in truths)
+    scores, hits = [], []
+    tp_at, fp_at = 0, 0
+    for boxes, truth in zip(preds, truths):
+        matched = np.zeros(len(truth), dtype=bool)
+        for box in boxes[np.argsort(-boxes[:, 4])]:
+            hit = False
+            if len(truth):
+                ious = box_iou(box[:4], truth)
+                ious[matched] = 0
+                best = int(np.argmax(ious))
+                if ious[best] >= MATCH_IOU:
+                    matched[best] = True
+                    hit = True
+            scores.append(box[4])
+            hits.append(hit)
+            if box[4] >= conf_threshold:
+                tp_at += hit
+                fp_at += not hit
+
+    if n_truth == 0:
+        return {"map50": float("nan"), "precision": float("nan"), "recall": float("nan"), "truth": 0}
+
+    order = np.argsort(-np.array(scores))
+    hits = np.array(hits, dtype=float)[order]
+    tp = np.cumsum(hits)
+    fp = np.cumsum(1 - hits)
+    recall = tp / n_truth
+    precision = tp / np.maximum(tp + fp, 1e-9)
+
+    # All-point interpolated AP
+    mrec = np.concatenate([[0.0], recall, [1.0]])
+    mpre = np.concatenate([[1.0], precision, [0.0]])
+    mpre = np.flip(np.maximum.accumulate(np.flip(mpre)))
+    idx = np.where(mrec[1:] != mrec[:-1])[0]
+    ap = float(np.sum((mrec[idx + 1] - mrec[idx]) * mpre[idx + 1]))
+
+    return {
+        "map50": ap,
+        "precision": tp_at / max(tp_at + fp_at, 1),
+        "recall": tp_at / n_truth,
+        "truth": n_truth,
+    }
+
+
+def latency_stats(latencies):
+    ms = np.array(latencies) * 1000
+    return {"mean_ms": float(ms.mean()), "p50_ms": float(np.percentile(ms, 50)), "p95_ms": float(np.percentile(ms, 95))}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare fp32 and INT8 person detection")
+    parser.add_argument("images", help="folder of evaluation images")
+    parser.add_argument("--labels", default=None,
+                        help="folder of YOLO .txt labels (default: fp32 detections as reference)")
+    parser.add_argument("--model", default=MODEL_PATH, help="fp32 .pt model")
+    parser.add_argument("--int8", default=None, help="INT8 .onnx model (built from --mode if missing)")
+    parser.add_argument("--mode", choices=("dynamic", "static"), default="static")
+    parser.add_argument("--calib-dir", default=None, help="calibration images for static mode")
+    parser.add_argument("--max-map-drop", type=float, default=0.02, help="allowed absolute mAP@0.5 drop")
+    parser.add_argument("--max-recall-drop", type=float, default=0.02,
+                        help=f"allowed absolute recall drop at conf={CONF_BASE}")
+    args = parser.parse_args()
+    needs_export = args.int8 is None or not os.path.exists(args.int8)
+    if needs_export and args.mode == "static" and not args.calib_dir:
+        parser.error("building a static INT8 model needs --calib-dir (or pass --int8 <model.onnx>, or --mode dynamic)")
+    return args
+
+
+def main():
+    args = parse_args()
+    image_paths = list_images(args.images)
+    if not image_paths:
+        sys.exit(f"No images found in {args.images}")
+
+    if args.int8 is None:
+        # Same per-calibration-folder cache the server and demo use
+        int8_path = resolve_model(args.model, args.mode, args.calib_dir)
+    elif not os.path.exists(args.int8):
+        int8_path = export_int8(args.model, args.mode, args.calib_dir, args.int8)
+    else:
+        int8_path = args.int8
+
+    print(f"[eval] {len(image_paths)} images, fp32={args.model}, int8={int8_path}")
+    fp32_preds, fp32_lat, fp32_mem = run_isolated(args.model, image_paths)
+    int8_preds, int8_lat, int8_mem = run_isolated(int8_path, image_paths)
+
+    if args.labels:
+        truths = []
+        for path in image_paths:
+            height, width = cv2.imread(path).shape[:2]
+            label_path = os.path.join(args.labels, os.path.splitext(os.path.basename(path))[0] + ".txt")
+            truths.append(load_labels(label_path, width, height))
+        source = "labels"
+    else:
+        truths = [boxes[boxes[:, 4] >= CONF_BASE, :4] for boxes in fp32_preds]
+        source = "fp32 reference"
+
+    fp32 = dict(evaluate(fp32_preds, truths), **latency_stats(fp32_lat), peak_rss_mb=fp32_mem)
+    int8 = dict(evaluate(int8_preds, truths), **latency_stats(int8_lat), peak_rss_mb=int8_mem)
+
+    print(f"[eval] ground truth: {source}, {fp32['truth']} person boxes")
+    print(f"{'':14}{'fp32':>10}{'int8':>10}{'delta':>10}")
+    for key in ("map50", "precision", "recall", "mean_ms", "p50_ms", "p95_ms", "peak_rss_mb"):
+        print(f"{key:14}{fp32[key]:10.3f}{int8[key]:10.3f}{int8[key] - fp32[key]:+10.3f}")
+    print(f"speedup (mean latency): {fp32['mean_ms'] / max(int8['mean_ms'], 1e-9):.2f}x")
+
+    # NaN metrics compare False against any bound, so an empty reference would always pass
+    if fp32["truth"] == 0 or any(np.isnan(m[key]) for m in (fp32, int8) for key in ("map50", "recall")):
+        print(f"❌ Nothing to evaluate: no person boxes in the {source}")
+        sys.exit(1)
+
+    failures = []
+    if fp32["map50"] - int8["map50"] > args.max_map_drop:
+        failures.append(f"mAP@0.5 dropped {fp32['map50'] - int8['map50']:.3f} (> {args.max_map_drop})")
+    if fp32["recall"] - int8["recall"] > args.max_recall_drop:
+        failures.append(f"recall dropped {fp32['recall'] - int8['recall']:.3f} (> {args.max_recall_drop})")
+    if failures:
+        print("❌ INT8 regression: " + "; ".join(failures))
+        sys.exit(1)
+    print("✅ INT8 model within bounds")
+
+
+if __name__ == "__main__":
+    main()
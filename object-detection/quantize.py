@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+INT8 quantized YOLO model for CPU inference.
+
+Exports the fp32 .pt model to ONNX and quantizes it with onnxruntime,
+either dynamically (weights only) or statically with activation ranges
+calibrated on a local folder of images. The resulting .onnx file loads
+with YOLO(...) like the .pt model, so predict() calls stay unchanged.
+
+Needs:  pip install onnx onnxruntime
+"""
+import argparse
+import hashlib
+import os
+
+import cv2
+import numpy as np
+from ultralytics import YOLO
+
+import preprocess
+
+MODEL_PATH = "yolov8n.pt"
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def list_images(folder):
+    return sorted(
+        os.path.join(folder, name) for name in os.listdir(folder)
+        if name.lower().endswith(IMAGE_EXTS)
+    )
+
+
+class FolderCalibrationReader:
+    """onnxruntime CalibrationDataReader over a folder of images"""
+
+    def __init__(self, folder, input_name, limit=200):
+        self.paths = list_images(folder)[:limit]
+        if not self.paths:
+            raise RuntimeError(f"No calibration images found in {folder}")
+        self.input_name = input_name
+        self._iter = iter(self.paths)
+
+    def get_next(self):
+        for path in self._iter:
+            frame_bgr = cv2.imread(path)
+            if frame_bgr is None:
+                continue
+            # predict() treats numpy input as BGR and flips it, so the network
+            # sees the channel-reversed model input; calibrate on exactly that
+            model_input, _ = preprocess.model_input(cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB))
+            net_in = model_input[:, :, ::-1]
+            blob = np.ascontiguousarray(net_in.transpose(2, 0, 1))[None].astype(np.float32) / 255.0
+            return {self.input_name: blob}
+        return None
+
+    def rewind(self):
+        self._iter = iter(self.paths)
+
+
+def export_int8(model_path=MODEL_PATH, mode="dynamic", calib_dir=None, output_path=None, calib_limit=200):
+    """Export model_path to ONNX and quantize it to INT8. Returns the .onnx path."""
+    try:
+        import onnxruntime as ort
+        from onnxruntime.quantization import (
+            CalibrationMethod, QuantFormat, QuantType, quantize_dynamic, quantize_static
+        )
+    except ImportError:
+        raise RuntimeError("INT8 models need onnx and onnxruntime (pip install onnx onnxruntime)")
+
+    if mode == "static" and not calib_dir:
+        raise ValueError("Static INT8 quantization needs a calibration image folder")
+
+    base = os.path.splitext(model_path)[0]
+    output_path = output_path or f"{base}_int8_{mode}.onnx"
+
+    # Dynamic axes so the letterboxed rectangular inputs (e.g. 640x384) run as-is
+    fp32_onnx = YOLO(model_path).export(
+        format="onnx", imgsz=preprocess.IMG_SIZE, dynamic=True, simplify=True, verbose=False
+    )
+
+    if mode == "dynamic":
+        quantize_dynamic(fp32_onnx, output_path, weight_type=QuantType.QUInt8)
+    else:
+        input_name = ort.InferenceSession(fp32_onnx, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+        quantize_static(
+            fp32_onnx,
+            output_path,
+            FolderCalibrationReader(calib_dir, input_name, limit=calib_limit),
+            quant_format=QuantFormat.QDQ,
+            per_channel=True,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            calibrate_method=CalibrationMethod.MinMax,
+        )
+    print(f"[int8] {mode} quantized model written to {output_path}")
+    return output_path
+
+
+def int8_model_path(model_path=MODEL_PATH, quantize="dynamic", calib_dir=None):
+    """Cache path of an INT8 export; static exports are keyed by the calibration folder's path"""
+    base = f"{os.path.splitext(model_path)[0]}_int8_{quantize}"
+    if quantize == "static" and calib_dir:
+        base += "_" + hashlib.sha1(os.path.abspath(calib_dir).encode("utf-8")).hexdigest()[:8]
+    return base + ".onnx"
+
+
+def resolve_model(model_path=MODEL_PATH, quantize=None, calib_dir=None):
+    """Path of the model to load, exporting the INT8 model on first use"""
+    if not quantize:
+        return model_path
+    int8_path = int8_model_path(model_path, quantize, calib_dir)
+    if not os.path.exists(int8_path):
+        export_int8(model_path, quantize, calib_dir, int8_path)
+    return int8_path
+
+
+def load_model(model_path=MODEL_PATH, quantize=None, calib_dir=None):
+    """YOLO model, optionally replaced by its INT8 export (built once, then reused)"""
+    if not quantize:
+        return YOLO(model_path)
+    return YOLO(resolve_model(model_path, quantize, calib_dir), task="detect")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export an INT8 quantized YOLO model")
+    parser.add_argument("--model", default=MODEL_PATH, help="fp32 .pt model")
+    parser.add_argument("--mode", choices=("dynamic", "static"), default="static")
+    parser.add_argument("--calib-dir", default=None, help="folder of calibration images (static mode)")
+    parser.add_argument("--calib-limit", type=int, default=200, help="max calibration images")
+    parser.add_argument("-o", "--output", default=None, help="output .onnx path")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    export_int8(args.model, args.mode, args.calib_dir, args.output, args.calib_limit)
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Frame + detection recording and deterministic replay.
+
+A recording is two append-only files:
+  <name>.htxr      records of [magic][meta length][jpeg length][meta JSON][JPEG]
+  <name>.htxr.idx  one fixed-size index entry per record (offset, lengths, timestamp)
+
+The index is written after its record, so a crash never leaves an index
+entry pointing at a partial record. Both files are read through
+np.memmap; frames are decoded straight from the mapped bytes.
+
+Replay:
+  python webrtc_demo.py --replay session.htxr [--replay-speed max]
+  python recording.py session.htxr --url http://localhost:8080 [--speed max]
+"""
+import argparse
+import asyncio
+import base64
+import math
+import os
+import queue
+import struct
+import threading
+import time
+
+import aiohttp
+import cv2
+import numpy as np
+
+import serialization
+
+RECORD_MAGIC = b"HTXR"
+RECORD_HEADER = struct.Struct("<4sII")  # magic, meta length, jpeg length
+INDEX_DTYPE = np.dtype([
+    ("offset", "<u8"),        # start of the record in the data file
+    ("meta_length", "<u4"),
+    ("jpeg_length", "<u4"),
+    ("timestamp", "<f8"),     # capture time, seconds
+])
+
+
+def index_path(path):
+    return path + ".idx"
+
+
+class FrameRecorder:
+    """Append frames, detections and stage timings to a recording.
+
+    JPEG encoding and file writes happen on a background thread; if it
+    falls behind by more than max_pending frames, new frames are dropped
+    and counted rather than stalling the capture loop. An existing
+    recording at path is replaced: one file holds one session, so
+    replay timing never spans the gap between two of them.
+    """
+
+    def __init__(self, path, quality=90, max_pending=64):
+        self.path = path
+        self.quality = quality
+        self.data_file = open(path, "wb")
+        self.index_file = open(index_path(path), "wb")
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self.error = None  # set if the writer thread fails (e.g. disk full)
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._writer, name="recorder", daemon=True)
+        self._thread.start()
+
+    def write(self, frame_bgr, detections=None, timings=None, timestamp=None):
+        """Queue one frame; the frame must not be modified afterwards"""
+        if not frame_bgr.flags.owndata:
+            # Views into reused buffers (e.g. the shared-memory ring) change under us
+            frame_bgr = frame_bgr.copy()
+        meta = {
+            "detections": detections or [],
+            "timings": timings or {},
+            "width": frame_bgr.shape[1],
+            "height": frame_bgr.shape[0],
+        }
+        if self.error is not None:
+            self.frames_dropped += 1
+            return
+        try:
+            self._queue.put_nowait((frame_bgr, meta, timestamp or time.time()))
+        except queue.Full:
+            self.frames_dropped += 1
+
+    def _writer(self):
+        encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), self.quality]
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                frame_bgr, meta, timestamp = item
+                _, jpeg = cv2.imencode('.jpg', frame_bgr, encode_param)
+                meta_bytes = serialization.dumps_json(meta)
+                offset = self.data_file.tell()
+                self.data_file.write(RECORD_HEADER.pack(RECORD_MAGIC, len(meta_bytes), jpeg.nbytes))
+                self.data_file.write(meta_bytes)
+                self.data_file.write(jpeg.tobytes())
+                self.data_file.flush()
+                entry = np.array([(offset, len(meta_bytes), jpeg.nbytes, timestamp)], dtype=INDEX_DTYPE)
+                self.index_file.write(entry.tobytes())
+                self.index_file.flush()
+                self.frames_written += 1
+        except Exception as e:
+            # The index is only written after its record, so what is on disk stays readable
+            self.error = e
+            print(f"[rec] recording stopped after {self.frames_written} frames: {e}")
+
+    def close(self):
+        # A dead writer never drains the queue: only wait for room while it is alive
+        while self._thread.is_alive():
+            try:
+                self._queue.put(None, timeout=0.5)
+                break
+            except queue.Full:
+                continue
+        self._thread.join()
+        self.data_file.close()
+        self.index_file.close()
+
+
+class RecordingReader:
+    """Memory-mapped random access to a recording"""
+
+    def __init__(self, path):
+        self.path = path
+        data_size = os.path.getsize(path)
+        index_size = os.path.getsize(index_path(path))
+        count = index_size // INDEX_DTYPE.itemsize  # ignore a partially written last entry
+        self.data = np.memmap(path, dtype=np.uint8, mode="r") if data_size else np.zeros(0, np.uint8)
+        self.index = (
+            np.memmap(index_path(path), dtype=INDEX_DTYPE, mode="r", shape=(count,))
+            if count else np.zeros(0, dtype=INDEX_DTYPE)
+        )
+
+    def __len__(self):
+        return len(self.index)
+
+    def _record(self, i):
+        entry = self.index[i]
+        start = int(entry["offset"]) + RECORD_HEADER.size
+        meta_end = start + int(entry["meta_length"])
+        return entry, self.data[start:meta_end], self.data[meta_end:meta_end + int(entry["jpeg_length"])]
+
+    def jpeg(self, i):
+        """Compressed frame bytes as a view into the mapping"""
+        return self._record(i)[2]
+
+    def frame(self, i):
+        return cv2.imdecode(self.jpeg(i), cv2.IMREAD_COLOR)
+
+    def meta(self, i):
+        return serialization.loads_json(self._record(i)[1].tobytes())
+
+    def timestamp(self, i):
+        return float(self.index[i]["timestamp"])
+
+
+def parse_speed(value):
+    """Replay speed: "original", "max", or a positive factor (argparse type)"""
+    if value in ("original", "max"):
+        return value
+    try:
+        factor = float(value)
+    except (TypeError, ValueError):
+        factor = 0.0
+    if not factor > 0 or math.isinf(factor):
+        raise argparse.ArgumentTypeError(f"replay speed must be original, max or a positive number, got {value!r}")
+    return factor
+
+
+class ReplaySource:
+    """cv2.VideoCapture-like source that plays a recording back.
+
+    speed="original" sleeps to reproduce the recorded frame timing,
+    speed="max" returns frames as fast as they are read, and a number
+    scales the original timing (2.0 = twice as fast).
+    """
+
+    def __init__(self, path, speed="original"):
+        self.reader = RecordingReader(path)
+        self.speed = parse_speed(speed)
+        self.position = 0
+        self._start_wall = None
+        self._start_ts = None
+
+    def isOpened(self):
+        return self.position < len(self.reader)
+
+    def next_delay(self):
+        """Seconds until the next frame is due; await this instead of letting read() block"""
+        if self.speed == "max" or self.position >= len(self.reader):
+            return 0.0
+        factor = 1.0 if self.speed == "original" else self.speed
+        if self._start_wall is None:
+            self._start_wall = time.monotonic()
+            self._start_ts = self.reader.timestamp(self.position)
+        due = self._start_wall + (self.reader.timestamp(self.position) - self._start_ts) / factor
+        return max(0.0, due - time.monotonic())
+
+    def read(self):
+        if self.position >= len(self.reader):
+            return False, None
+        delay = self.next_delay()
+        if delay > 0:
+            time.sleep(delay)
+        i = self.position
+        self.position += 1
+        return True, self.reader.frame(i)
+
+    def release(self):
+        self.position = len(self.reader)
+
+
+async def replay_inference(path, url, speed="max"):
+    """POST every recorded frame to /inference and report latency"""
+    speed = parse_speed(speed)
+    reader = RecordingReader(path)
+    latencies = []
+    start_wall = time.monotonic()
+    async with aiohttp.ClientSession() as session:
+        for i in range(len(reader)):
+            if speed != "max":
+                factor = 1.0 if speed == "original" else speed
+                due = start_wall + (reader.timestamp(i) - reader.timestamp(0)) / factor
+                await asyncio.sleep(max(0.0, due - time.monotonic()))
+            payload = {"image": base64.b64encode(reader.jpeg(i)).decode("ascii")}
+            started = time.monotonic()
+            async with session.post(f"{url}/inference", json=payload) as response:
+                await response.read()
+                status = response.status
+            latencies.append(time.monotonic() - started)
+            if status != 200:
+                print(f"[replay] frame {i}: HTTP {status}")
+
+    elapsed = time.monotonic() - start_wall
+    ms = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    print(f"[replay] {len(latencies)} frames in {elapsed:.1f}s ({len(latencies) / max(elapsed, 1e-9):.1f} FPS), "
+          f"latency mean {ms.mean():.1f} ms, p50 {np.percentile(ms, 50):.1f} ms, p95 {np.percentile(ms, 95):.1f} ms")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Replay a recording through the /inference endpoint")
+    parser.add_argument("recording", help=".htxr recording")
+    parser.add_argument("--url", default="http://localhost:8080", help="server base URL")
+    parser.add_argument("--speed", type=parse_speed, default="max", help="original, max, or a speed factor")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    asyncio.run(replay_inference(args.recording, args.url, args.speed))
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Response and broadcast serialization.
+
+JSON goes through orjson when it is installed (stdlib json otherwise) and
+MessagePack is offered to clients that ask for it, either with an
+`Accept: application/msgpack` header or the `msgpack` WebSocket
+subprotocol. NumPy arrays and scalars are encoded directly, and raw bytes
+(e.g. JPEG frames) are sent as binary in MessagePack and as base64 in JSON.
+
+Detections stay lists of per-box dicts ({"confidence", "bbox": {x1..y2}}):
+that is the format the Next.js frontend and existing clients read, so the
+array encoders only apply to payloads that already carry NumPy arrays.
+"""
+import base64
+import json
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON = "json"
+MSGPACK = "msgpack"
+
+CONTENT_TYPES = {
+    JSON: "application/json",
+    MSGPACK: "application/msgpack",
+}
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+
+# WebSocket subprotocols the server accepts, preferred first
+WS_PROTOCOLS = (MSGPACK, JSON) if msgpack is not None else (JSON,)
+
+
+def _json_default(obj):
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        return base64.b64encode(obj).decode("ascii")
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def _msgpack_default(obj):
+    if isinstance(obj, np.ndarray):
+        # Raw little-endian buffer; clients wrap it in a typed array without per-element parsing
+        arr = np.ascontiguousarray(obj, dtype=obj.dtype.newbyteorder("<"))
+        return {"dtype": arr.dtype.str, "shape": list(arr.shape), "data": arr.tobytes()}
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, memoryview):
+        return obj.tobytes()
+    raise TypeError(f"Type is not MessagePack serializable: {type(obj).__name__}")
+
+
+def dumps_json(obj):
+    """JSON as bytes"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_json_default, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, default=_json_default).encode("utf-8")
+
+
+def loads_json(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps_msgpack(obj):
+    return msgpack.packb(obj, default=_msgpack_default, use_bin_type=True)
+
+
+def dumps(obj, fmt=JSON):
+    return dumps_msgpack(obj) if fmt == MSGPACK else dumps_json(obj)
+
+
+def negotiate(accept_header):
+    """Pick the response format from an HTTP Accept header"""
+    if msgpack is not None and accept_header:
+        media_types = [part.split(";")[0].strip().lower() for part in accept_header.split(",")]
+        if any(media in MSGPACK_MEDIA_TYPES for media in media_types):
+            return MSGPACK
+    return JSON
+
+
+def ws_format(ws):
+    """Format for a prepared WebSocketResponse, from its negotiated subprotocol"""
+    return MSGPACK if ws.ws_protocol == MSGPACK else JSON
@@ -1,81 +1,87 @@
 #!/usr/bin/env python3
+import argparse
 import asyncio
 import cv2
 import numpy as np
 import sys
 import os
-import torch
-from PIL import Image
-import torchvision.transforms as T
-from ultralytics import YOLO
 import time
 
-# Import the WebRTC server
-from webrtc_server import get_server
+# Keep top-level imports free of torch/ultralytics: spawned capture and batch
+# workers re-import this module, so model code is imported where it is used
+from capture import open_source, start_shm_capture
+from recording import FrameRecorder, ReplaySource, parse_speed
+import preprocess
 
 # Configuration (exactly like live_patch_attack.py)
 MODEL_PATH = "yolov8n.pt"
-IMG_SIZE = 640
+IMG_SIZE = preprocess.IMG_SIZE
 CONF_BASE = 0.75
 device = "cpu"
 
 # ===== Smoothing for confidence meter =====
 SMOOTH_ALPHA = 0.25   # 0..1 (lower = smoother, less sudden)
 
-# =================== MODEL ====================
-model = YOLO(MODEL_PATH)
-to_tensor = T.ToTensor()
-resize640 = T.Resize((IMG_SIZE, IMG_SIZE))
-
-def tensor_to_uint8(img_t):
-    arr = (img_t.permute(1, 2, 0).clamp(0, 1).cpu().numpy() * 255).astype(np.uint8)
-    return np.ascontiguousarray(arr)
-
-def open_camera(preferred_index=0):
-    """Try to open camera with different backends"""
-    backends = [cv2.CAP_MSMF, cv2.CAP_DSHOW, cv2.CAP_ANY]
-    tried = set()
-    for backend in backends:
-        for idx in [preferred_index]:
-            key = (backend, idx)
-            if key in tried:
-                continue
-            tried.add(key)
-            cap = cv2.VideoCapture(idx, backend)
-            if cap.isOpened():
-                cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
-                cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
-                print(f"[cam] opened index={idx} backend={backend}")
-                return cap
-            cap.release()
-    return None
+def parse_args():
+    parser = argparse.ArgumentParser(description="YOLO person detection streamed over WebRTC")
+    parser.add_argument("source", nargs="?", default=None,
+                        help="video file to play (default: camera 0)")
+    parser.add_argument("--shm-capture", action="store_true",
+                        help="capture in a separate process and hand frames over shared memory")
+    parser.add_argument("--shm-slots", type=int, default=4,
+                        help="frame slots in the shared-memory ring")
+    parser.add_argument("--int8", choices=("dynamic", "static"), default=None,
+                        help="use the INT8 quantized model (exported on first use)")
+    parser.add_argument("--calib-dir", default=None,
+                        help="calibration image folder for --int8 static")
+    parser.add_argument("--record", default=None,
+                        help="record incoming frames, detections and stage timings to this .htxr file (replaced if it exists)")
+    parser.add_argument("--replay", default=None,
+                        help="use a .htxr recording as the video source")
+    parser.add_argument("--replay-speed", type=parse_speed, default="original",
+                        help="replay pacing: original, max, or a speed factor")
+    parser.add_argument("--headless", action="store_true",
+                        help="batch-process the video file as fast as possible, no server or window")
+    parser.add_argument("--output", default=None,
+                        help="headless: detections file, .npz or .parquet")
+    parser.add_argument("--annotate", default=None,
+                        help="headless: also write an annotated video here")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="headless: worker processes over file segments")
+    parser.add_argument("--batch-size", type=int, default=8,
+                        help="headless: frames per model.predict call")
+    return parser.parse_args()
 
 
 async def main():
     # Get video source (exactly like live_patch_attack.py)
-    VIDEO_SOURCE = sys.argv[1] if len(sys.argv) > 1 else None
+    args = parse_args()
+    VIDEO_SOURCE = args.source
     
     print("Initializing video source...")
     
-    if VIDEO_SOURCE and os.path.exists(VIDEO_SOURCE):
-        cap = cv2.VideoCapture(VIDEO_SOURCE)
-        if not cap.isOpened():
-            raise RuntimeError(f"Failed to open video file: {VIDEO_SOURCE}")
-        print(f"[vid] playing file: {VIDEO_SOURCE}")
+    # Imported here: building the global server loads a model, which spawned children must not do
+    from quantize import load_model
+    from webrtc_server import get_server
+    
+    shm_capture = None
+    if args.replay:
+        cap = ReplaySource(args.replay, args.replay_speed)
+        print(f"[replay] {len(cap.reader)} frames from {args.replay} at {args.replay_speed} speed")
+    elif args.shm_capture:
+        cap, shm_capture = start_shm_capture(VIDEO_SOURCE, args.shm_slots)
     else:
-        cap = open_camera(preferred_index=0)
-        if cap is None:
-            raise RuntimeError(
-                "No camera opened. Close Teams/Zoom/OBS/Camera app and try again.\n"
-                "Or run with a video file:  python webrtc_demo.py path\\to\\video.mp4"
-            )
+        cap = open_source(VIDEO_SOURCE)
     
     # Load YOLO model
     print("Loading YOLO model...")
-    model = YOLO(MODEL_PATH)
+    model = load_model(MODEL_PATH, args.int8, args.calib_dir)
     
     # Get WebRTC server
     server = get_server()
+    if args.int8:
+        # Own instance: /inference predicts on a worker thread, and YOLO predictors are not thread-safe
+        server.load_models(args.int8, args.calib_dir)
     
     # Start server in background
     server_task = asyncio.create_task(server.start_server())
@@ -87,8 +93,13 @@ async def main():
     print("Open your browser and go to http://localhost:8080 to view the stream")
     print("Press 'q' to quit")
     
+    recorder = FrameRecorder(args.record) if args.record else None
+    if recorder is not None:
+        print(f"[rec] recording to {args.record}")
+    
     # Start camera loop in a separate task
-    camera_task = asyncio.create_task(camera_loop(cap, model, server))
+    frame_delay = 0 if args.replay else 0.033
+    camera_task = asyncio.create_task(camera_loop(cap, model, server, recorder, frame_delay))
     
     try:
         # Keep the server running
@@ -98,46 +109,45 @@ async def main():
     finally:
         camera_task.cancel()
         server_task.cancel()
+        if shm_capture is not None:
+            print(f"[shm] ring stats: {cap.ring.stats()}")
+            shm_capture.stop()
+        if recorder is not None:
+            recorder.close()
+            print(f"[rec] {recorder.frames_written} frames written, {recorder.frames_dropped} dropped")
         if cap is not None:
             cap.release()
         cv2.destroyAllWindows()
 
-async def camera_loop(cap, model, server):
+async def camera_loop(cap, model, server, recorder=None, frame_delay=0.033):
     """Camera processing loop"""
     frame_count = 0
     start_time = time.time()
     
     try:
         while True:
+            # Recordings are paced here so gaps in them never block the event loop
+            if isinstance(cap, ReplaySource):
+                await asyncio.sleep(cap.next_delay())
+            t_start = time.perf_counter()
             ret, frame = cap.read()
             if not ret:
                 print("[warn] frame read failed; stopping.")
                 break
+            capture_ts = time.time()
+            t_read = time.perf_counter()
             
             # Convert to RGB for processing (exactly like live_patch_attack.py)
             frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
             
-            # Create a separate copy for YOLO model processing with brightness adjustments
-            model_frame_rgb = frame_rgb.copy()
-            
-            # Apply brightness adjustments only to the model processing frame
-            gray = cv2.cvtColor(model_frame_rgb, cv2.COLOR_RGB2GRAY)
-            if np.mean(gray) > 100:  # Bright lighting detected
-                # Reduce brightness and enhance contrast
-                model_frame_rgb = cv2.convertScaleAbs(model_frame_rgb, alpha=0.7, beta=-30)
-                clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-                lab = cv2.cvtColor(model_frame_rgb, cv2.COLOR_RGB2LAB)
-                lab[:,:,0] = clahe.apply(lab[:,:,0])
-                model_frame_rgb = cv2.cvtColor(lab, cv2.COLOR_LAB2RGB)
-
-            # Resize to model size (exactly like live_patch_attack.py)
-            img_t = to_tensor(resize640(Image.fromarray(model_frame_rgb))).to(device)
-            np_640 = tensor_to_uint8(img_t)
+            # Brightness-adjusted, letterboxed model input (e.g. 640x384 for 1280x720)
+            model_input, shape = preprocess.model_input(frame_rgb)
+            t_preprocess = time.perf_counter()
 
             # ===== Inference ===== (exactly like live_patch_attack.py)
             res = model.predict(
-                source=np_640,
-                imgsz=IMG_SIZE,
+                source=model_input,
+                imgsz=[shape.input_h, shape.input_w],
                 conf=CONF_BASE,
                 iou=0.30,
                 augment=False,
@@ -146,18 +156,20 @@ async def camera_loop(cap, model, server):
                 device=device,
                 verbose=False
             )[0]
+            t_inference = time.perf_counter()
             
-            # Process results
+            # Process results, boxes in camera frame pixels
             detections = []
             if res.boxes is not None and len(res.boxes) > 0:
-                for box in res.boxes:
+                xyxy = preprocess.boxes_to_source(res.boxes.xyxy.cpu().numpy(), shape)
+                for conf, (x1, y1, x2, y2) in zip(res.boxes.conf.cpu().numpy(), xyxy):
                     detections.append({
-                        "confidence": float(box.conf.item()),
+                        "confidence": float(conf),
                         "bbox": {
-                            "x1": float(box.xyxy[0][0].item()),
-                            "y1": float(box.xyxy[0][1].item()),
-                            "x2": float(box.xyxy[0][2].item()),
-                            "y2": float(box.xyxy[0][3].item())
+                            "x1": float(x1),
+                            "y1": float(y1),
+                            "x2": float(x2),
+                            "y2": float(y2)
                         }
                     })
             
@@ -169,19 +181,27 @@ async def camera_loop(cap, model, server):
             # Calculate average confidence
             avg_confidence = np.mean([d["confidence"] for d in detections]) if detections else 0.0
             
-            # Resize the original frame to match model dimensions for proper coordinate mapping
-            frame_rgb_640 = cv2.resize(frame_rgb, (IMG_SIZE, IMG_SIZE))
-            vis = res.plot(img=frame_rgb_640)
+            # Draw on the letterboxed original frame so boxes line up with the model input
+            vis = res.plot(img=preprocess.letterbox(frame_rgb, shape))
             
-            # Resize back to original camera resolution for display
-            original_height, original_width = frame_rgb.shape[:2]
-            vis_resized = cv2.resize(vis, (original_width, original_height))
+            # Crop the padding and resize back to original camera resolution for display
+            vis_resized = preprocess.unletterbox(vis, shape)
             
             # Stream the annotated frame (with bounding boxes)
             # Convert RGB to BGR for the server (OpenCV format)
             vis_bgr_for_stream = cv2.cvtColor(vis_resized, cv2.COLOR_RGB2BGR)
             server.stream_frame(vis_bgr_for_stream)
             server.stream_inference(detections, avg_confidence, fps)
+            t_annotate = time.perf_counter()
+            
+            # Record the raw frame with its detections and per-stage timings (ms)
+            if recorder is not None:
+                recorder.write(frame, detections, {
+                    "read": (t_read - t_start) * 1000,
+                    "preprocess": (t_preprocess - t_read) * 1000,
+                    "inference": (t_inference - t_preprocess) * 1000,
+                    "annotate": (t_annotate - t_inference) * 1000
+                }, timestamp=capture_ts)
             
             # Show the annotated frame (convert RGB back to BGR for OpenCV display)
             vis_bgr = cv2.cvtColor(vis_resized, cv2.COLOR_RGB2BGR)
@@ -195,8 +215,8 @@ async def camera_loop(cap, model, server):
             if cv2.waitKey(1) & 0xFF == ord('q'):
                 break
             
-            # Small delay to prevent overwhelming the system
-            await asyncio.sleep(0.033)  # ~30 FPS
+            # Small delay to prevent overwhelming the system (replays pace themselves)
+            await asyncio.sleep(frame_delay)  # ~30 FPS
                 
     except Exception as e:
         print(f"Error in camera loop: {e}")
@@ -204,4 +224,14 @@ async def camera_loop(cap, model, server):
         traceback.print_exc()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    args = parse_args()
+    if args.headless:
+        if not args.source or not os.path.exists(args.source):
+            sys.exit("--headless needs a video file path")
+        output = args.output or os.path.splitext(args.source)[0] + ".detections.npz"
+        import batch_video
+        batch_video.process_video(
+            args.source, output, args.annotate, args.workers, args.batch_size, args.int8, args.calib_dir
+        )
+    else:
+        asyncio.run(main())
@@ -4,61 +4,144 @@ import numpy as np
 import base64
 import json
 import logging
+import math
+import os
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from aiohttp import web, WSMsgType
 import aiohttp_cors
-from ultralytics import YOLO
-import torch
-from PIL import Image
-import torchvision.transforms as T
+
+import bandwidth
+import preprocess
+import serialization
+import inference_channel
+from inference_channel import InferenceChannel
+from quantize import load_model
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+MAX_UPLOAD_BYTES = 20 * 1024 * 1024  # largest /inference request body
+UPLOAD_CHUNK_BYTES = 64 * 1024
+
+class UploadTooLarge(Exception):
+    pass
+
+class InvalidUpload(Exception):
+    pass
+
 class SimpleWebRTCServer:
-    def __init__(self, host="localhost", port=8080):
+    def __init__(self, host="localhost", port=8080, max_inflight=1, max_queue=8,
+                 quantize=None, calib_dir=None, max_upload_bytes=MAX_UPLOAD_BYTES):
         self.host = host
         self.port = port
+        self.max_upload_bytes = max_upload_bytes
         self.clients = set()
         self.frame_data = None
         self.inference_data = None
         
+        # Per-client throughput estimates and JPEG ladder encoding off the event loop
+        self.links = {}
+        self.channels = {}  # ws -> InferenceChannel for requests sent over /ws
+        self.rung_sizes = {}  # rung name -> recent JPEG size in bytes
+        self.encode_executor = ThreadPoolExecutor(
+            max_workers=len(bandwidth.JPEG_LADDER), thread_name_prefix="jpeg"
+        )
+        
+        # /inference admission control: bounded workers plus a bounded waiting queue
+        self.max_inflight = max_inflight
+        self.max_queue = max_queue
+        self.inference_slots = asyncio.Semaphore(max_inflight)
+        self.inference_executor = ThreadPoolExecutor(max_workers=max_inflight, thread_name_prefix="inference")
+        self.inference_inflight = 0
+        self.inference_waiting = 0
+        self.inference_completed = 0
+        self.inference_shed = 0
+        self.inference_expired = 0
+        self.inference_latency_ewma = 0.5  # seconds, refined as requests complete
+        
         # YOLO model and processing (same as live_patch_attack.py)
-        self.model = YOLO("yolov8n.pt")
-        self.img_size = 640
+        # Predictors are not thread-safe, so each inference thread gets its own instance
+        self._thread_models = threading.local()
+        self._model_lock = threading.Lock()
+        self.load_models(quantize, calib_dir)
+        self.img_size = preprocess.IMG_SIZE
         self.conf_base = 0.75  # Exactly like live_patch_attack.py
         self.device = "cpu"
-        self.to_tensor = T.ToTensor()
-        self.resize640 = T.Resize((self.img_size, self.img_size))
-        
-    def tensor_to_uint8(self, img_t):
-        arr = (img_t.permute(1, 2, 0).clamp(0, 1).cpu().numpy() * 255).astype(np.uint8)
-        return np.ascontiguousarray(arr)
         
+    def load_models(self, quantize=None, calib_dir=None):
+        """(Re)load the detector; quantize="dynamic"/"static" swaps in the INT8 ONNX export.
+
+        Loading here also builds the INT8 export once, before any worker needs it.
+        """
+        model = load_model("yolov8n.pt", quantize, calib_dir)
+        with self._model_lock:
+            self.quantize = quantize
+            self.calib_dir = calib_dir
+            self.model = model
+            self._model_claimed = False  # the first inference thread takes self.model
+
+    def worker_model(self):
+        """This inference thread's own model instance"""
+        local = self._thread_models
+        with self._model_lock:
+            if getattr(local, "source", None) is self.model:
+                return local.model
+            source, quantize, calib_dir = self.model, self.quantize, self.calib_dir
+            reuse = not self._model_claimed
+            self._model_claimed = True
+        local.model = source if reuse else load_model("yolov8n.pt", quantize, calib_dir)
+        local.source = source
+        return local.model
+
     async def websocket_handler(self, request):
         """Handle WebSocket connections"""
-        ws = web.WebSocketResponse()
+        # Clients asking for the "msgpack" subprotocol get binary MessagePack messages
+        # Binary inference requests carry a 4-byte id in front of an upload-sized image
+        ws = web.WebSocketResponse(
+            protocols=serialization.WS_PROTOCOLS,
+            max_msg_size=self.max_upload_bytes + inference_channel.REQUEST_ID.size
+        )
         await ws.prepare(request)
         
         self.clients.add(ws)
-        logger.info(f"Client connected. Total clients: {len(self.clients)}")
+        self.links[ws] = bandwidth.ClientLink()
+        channel = self.channels[ws] = InferenceChannel()
+        logger.info(f"Client connected ({serialization.ws_format(ws)}). Total clients: {len(self.clients)}")
         
         try:
             # Send welcome message
-            await ws.send_str(json.dumps({
+            await self.send_message(ws, {
                 "type": "connection",
                 "message": "Connected to WebRTC server",
                 "timestamp": time.time()
-            }))
+            })
             
             async for msg in ws:
-                if msg.type == WSMsgType.TEXT:
+                if msg.type == WSMsgType.BINARY:
+                    # [request id: uint32 BE][image bytes]
+                    request_id, image_data = inference_channel.parse_binary_request(msg.data)
+                    if not image_data:
+                        # Every request gets a result; admitted_inference never sees this one
+                        await self.send_ws_result(ws, request_id, 400, {"error": "No image provided"})
+                        continue
+                    await self.submit_ws_inference(ws, channel, (request_id, image_data, False))
+                elif msg.type == WSMsgType.TEXT:
                     try:
                         data = json.loads(msg.data)
-                        logger.info(f"Received: {data}")
                     except json.JSONDecodeError:
                         logger.error("Invalid JSON received")
+                        continue
+                    if not isinstance(data, dict):
+                        logger.info(f"Received: {data}")
+                    elif data.get("type") == "infer":
+                        await self.submit_ws_inference(ws, channel, (data.get("id"), data.get("image"), True))
+                    elif data.get("type") == "config":
+                        await self.configure_ws_client(ws, channel, data)
+                    else:
+                        logger.info(f"Received: {data}")
                 elif msg.type == WSMsgType.ERROR:
                     logger.error(f"WebSocket error: {ws.exception()}")
                     break
@@ -66,20 +149,112 @@ class SimpleWebRTCServer:
             logger.error(f"WebSocket error: {e}")
         finally:
             self.clients.discard(ws)
+            self.links.pop(ws, None)
+            self.channels.pop(ws, None)
+            channel.pending = None
+            for task in channel.tasks:
+                task.cancel()
             logger.info(f"Client disconnected. Total clients: {len(self.clients)}")
         
         return ws
     
+    async def configure_ws_client(self, ws, channel, data):
+        """Apply a {"type": "config"} message; "stream": false stops frame broadcasts"""
+        try:
+            dropped = channel.configure(data)
+        except (TypeError, ValueError):
+            logger.error(f"Invalid config received: {data}")
+            return
+        if dropped is not None:
+            await self.send_ws_result(ws, dropped[0], "dropped", {"error": "Live mode turned off"})
+        if "stream" in data:
+            if data["stream"]:
+                self.clients.add(ws)
+                self.links.setdefault(ws, bandwidth.ClientLink())
+            else:
+                self.clients.discard(ws)
+                self.links.pop(ws, None)
+
+    async def submit_ws_inference(self, ws, channel, request):
+        """Start, hold or refuse one /ws inference request under the channel's flow control"""
+        action, other = channel.offer(request)
+        if action == "run":
+            self.start_ws_inference(ws, channel, request)
+        elif action == "reject":
+            await self.send_ws_result(ws, request[0], 429, {"error": "Too many requests in flight"})
+        elif other is not None:
+            # Live mode: the newer frame replaces the one still waiting
+            await self.send_ws_result(ws, other[0], "dropped", {"error": "Superseded by a newer frame"})
+
+    def start_ws_inference(self, ws, channel, request):
+        task = asyncio.ensure_future(self.run_ws_inference(ws, channel, request))
+        channel.tasks.add(task)
+        task.add_done_callback(channel.tasks.discard)
+
+    async def run_ws_inference(self, ws, channel, request):
+        request_id, image_data, is_base64 = request
+        deadline = None
+        if channel.deadline_ms is not None:
+            deadline = time.monotonic() + channel.deadline_ms / 1000.0
+
+        async def read_image():
+            return image_data, is_base64
+
+        try:
+            status, payload, headers = await self.admitted_inference(read_image, deadline, channel.annotate)
+            if headers and "Retry-After" in headers:
+                payload = dict(payload, retry_after=int(headers["Retry-After"]))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error in WebSocket inference: {e}")
+            status, payload = 500, {"error": str(e)}
+
+        next_request = channel.finish()
+        if next_request is not None and not ws.closed:
+            self.start_ws_inference(ws, channel, next_request)
+        await self.send_ws_result(ws, request_id, status, payload)
+
+    async def send_ws_result(self, ws, request_id, status, payload):
+        if ws.closed:
+            return
+        try:
+            await self.send_message(ws, {"type": "result", "id": request_id, "status": status, **payload})
+        except Exception as e:
+            logger.error(f"Error sending inference result: {e}")
+
+    def encode_message(self, ws, message, encoded=None):
+        """(payload, size in bytes) in the client's negotiated format; encoded caches per format"""
+        fmt = serialization.ws_format(ws)
+        if encoded is None:
+            encoded = {}
+        if fmt not in encoded:
+            data = serialization.dumps(message, fmt)
+            # JSON goes out as a text frame: decode once per message, not once per client
+            encoded[fmt] = (data if fmt == serialization.MSGPACK else data.decode('utf-8'), len(data))
+        return encoded[fmt]
+
+    async def send_message(self, ws, message, encoded=None):
+        """Send a message in the client's negotiated format. Returns its size in bytes."""
+        payload, nbytes = self.encode_message(ws, message, encoded)
+        if isinstance(payload, str):
+            await ws.send_str(payload)
+        else:
+            await ws.send_bytes(payload)
+        return nbytes
+    
     async def broadcast_data(self, data_type, data):
         """Broadcast data to all connected clients"""
         if not self.clients:
             return
             
-        message = json.dumps({
+        message = {
             "type": data_type,
             "data": data,
             "timestamp": time.time()
-        })
+        }
+        # Serialized once per format, shared by every client using it
+        encoded = {}
         
         # Create a copy of clients to avoid modification during iteration
         clients_copy = list(self.clients)
@@ -87,7 +262,7 @@ class SimpleWebRTCServer:
         
         for client in clients_copy:
             try:
-                await client.send_str(message)
+                await self.send_message(client, message, encoded)
             except Exception as e:
                 logger.error(f"Error sending to client: {e}")
                 disconnected.add(client)
@@ -96,24 +271,58 @@ class SimpleWebRTCServer:
         self.clients -= disconnected
     
     def stream_frame(self, frame_bgr):
-        """Stream frame data"""
+        """Stream frame data (JPEG encoding happens per ladder rung in broadcast_frame)"""
+        self.frame_data = frame_bgr
+    
+    async def broadcast_frame(self, frame_bgr):
+        """Send each client the best JPEG rung its measured throughput can sustain"""
+        # Clients still sending the previous frame skip this one instead of queueing it
+        ready = []
+        for client in list(self.clients):
+            link = self.links.get(client)
+            if link is None:
+                continue
+            if link.busy:
+                link.record_skip()
+            else:
+                ready.append((client, link))
+        if not ready:
+            return
+        
+        # Encode only the rungs somebody is subscribed to, in parallel worker threads
+        rungs = list({link.choose_rung(self.rung_sizes) for _, link in ready})
+        loop = asyncio.get_running_loop()
+        jpegs = await asyncio.gather(*(
+            loop.run_in_executor(self.encode_executor, bandwidth.encode_rung, frame_bgr, rung)
+            for rung in rungs
+        ))
+        
+        messages = {}
+        for rung, jpeg in zip(rungs, jpegs):
+            self.rung_sizes[rung.name] = len(jpeg)
+            # Raw bytes: binary in MessagePack, base64 in JSON
+            messages[rung.name] = ({
+                "type": "frame",
+                "data": {"frame": jpeg, "format": "jpeg", "quality": rung.name},
+                "timestamp": time.time()
+            }, {})
+        
+        for client, link in ready:
+            message, encoded = messages[link.rung.name]
+            link.send_task = asyncio.create_task(self.timed_send(client, link, message, encoded))
+    
+    async def timed_send(self, client, link, message, encoded):
+        """Send one frame and feed its completion time into the client's throughput estimate"""
         try:
-            # Encode frame as JPEG
-            encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), 85]
-            _, buffer = cv2.imencode('.jpg', frame_bgr, encode_param)
-            frame_bytes = buffer.tobytes()
-            
-            # Encode as base64
-            frame_b64 = base64.b64encode(frame_bytes).decode('utf-8')
-            
-            # Store for async broadcast
-            self.frame_data = {
-                "frame": frame_b64,
-                "format": "jpeg"
-            }
-            
+            # Serialize outside the timed window (the first client of each format pays for it)
+            self.encode_message(client, message, encoded)
+            started = time.monotonic()
+            nbytes = await self.send_message(client, message, encoded)
+            link.record_send(nbytes, time.monotonic() - started)
         except Exception as e:
-            logger.error(f"Error encoding frame: {e}")
+            logger.error(f"Error sending frame to client: {e}")
+            self.clients.discard(client)
+            self.links.pop(client, None)
     
     def stream_inference(self, detections, confidence, fps):
         """Stream inference data"""
@@ -127,9 +336,9 @@ class SimpleWebRTCServer:
         """Background task to broadcast data"""
         while True:
             try:
-                if self.frame_data:
-                    await self.broadcast_data("frame", self.frame_data)
-                    self.frame_data = None
+                if self.frame_data is not None:
+                    frame_bgr, self.frame_data = self.frame_data, None
+                    await self.broadcast_frame(frame_bgr)
                 
                 if self.inference_data:
                     await self.broadcast_data("inference", self.inference_data)
@@ -142,7 +351,7 @@ class SimpleWebRTCServer:
     
     async def start_server(self):
         """Start the server"""
-        app = web.Application()
+        app = web.Application(client_max_size=self.max_upload_bytes)
         
         # Configure CORS
         cors = aiohttp_cors.setup(app, defaults={
@@ -158,6 +367,7 @@ class SimpleWebRTCServer:
         app.router.add_get('/ws', self.websocket_handler)
         app.router.add_get('/', self.serve_client)
         app.router.add_post('/inference', self.handle_inference)
+        app.router.add_get('/health', self.handle_health)
         
         # Add CORS to all routes
         for route in list(app.router.routes()):
@@ -173,118 +383,244 @@ class SimpleWebRTCServer:
         await site.start()
         logger.info("WebRTC server started successfully")
     
+    def respond(self, request, payload, status=200, headers=None):
+        """Serialize payload as JSON or MessagePack depending on the Accept header"""
+        fmt = serialization.negotiate(request.headers.get('Accept'))
+        return web.Response(
+            body=serialization.dumps(payload, fmt),
+            status=status,
+            headers=headers,
+            content_type=serialization.CONTENT_TYPES[fmt]
+        )
+
+    def parse_deadline(self, request, arrival):
+        """Absolute monotonic deadline from the X-Deadline-Ms header (remaining budget in ms)"""
+        value = request.headers.get('X-Deadline-Ms')
+        if value is None:
+            return None
+        try:
+            budget_ms = float(value)
+        except ValueError:
+            return None
+        if not math.isfinite(budget_ms):
+            return None
+        return arrival + max(budget_ms, 0.0) / 1000.0
+
+    def remaining(self, deadline):
+        """Seconds left until a parse_deadline() deadline, None without one"""
+        return None if deadline is None else max(deadline - time.monotonic(), 0.0)
+
+    def retry_after_seconds(self):
+        """Rough time until a queue slot frees up, for the Retry-After header"""
+        backlog = self.inference_inflight + self.inference_waiting
+        return max(1, math.ceil(backlog * self.inference_latency_ewma / self.max_inflight))
+
+    def inference_stats(self):
+        return {
+            "in_flight": self.inference_inflight,
+            "queued": self.inference_waiting,
+            "max_in_flight": self.max_inflight,
+            "max_queue": self.max_queue,
+            "completed": self.inference_completed,
+            "shed": self.inference_shed,
+            "expired": self.inference_expired,
+            "latency_ewma_ms": round(self.inference_latency_ewma * 1000, 1)
+        }
+
+    async def handle_health(self, request):
+        """Server health and /inference admission counters"""
+        return self.respond(request, {
+            "status": "ok",
+            "clients": len(self.clients),
+            "links": [link.stats() for link in self.links.values()],
+            "ws_inference": [channel.stats() for channel in self.channels.values()],
+            "inference": self.inference_stats()
+        })
+
+    async def read_upload(self, request):
+        """Stream the request body in chunks, enforcing the upload limit.
+
+        Returns (data, is_base64): the "image" field of a JSON body, or the
+        raw bytes of an image / application/octet-stream body.
+        """
+        chunks = []
+        size = 0
+        async for chunk in request.content.iter_chunked(UPLOAD_CHUNK_BYTES):
+            size += len(chunk)
+            if size > self.max_upload_bytes:
+                raise UploadTooLarge()
+            chunks.append(chunk)
+        body = b"".join(chunks)
+
+        if request.content_type == 'application/json':
+            try:
+                payload = serialization.loads_json(body)
+            except ValueError:
+                raise InvalidUpload("Invalid JSON body")
+            if not isinstance(payload, dict):
+                raise InvalidUpload("JSON body must be an object")
+            return payload.get('image'), True
+        return body, False
+
     async def handle_inference(self, request):
         """Handle image inference requests"""
+        arrival = time.monotonic()
+        deadline = self.parse_deadline(request, arrival)
+
+        if request.content_length is not None and request.content_length > self.max_upload_bytes:
+            return self.respond(request, {"error": "Upload too large"}, status=413)
+
         try:
-            # Get JSON data with base64 image
-            data = await request.json()
-            image_b64 = data.get('image')
-            
-            if not image_b64:
-                return web.Response(
-                    text=json.dumps({"error": "No image provided"}), 
-                    status=400,
-                    content_type='application/json'
-                )
-            
-            # Decode base64 image
-            image_data = base64.b64decode(image_b64)
-            nparr = np.frombuffer(image_data, np.uint8)
-            frame_bgr = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            
-            if frame_bgr is None:
-                return web.Response(
-                    text=json.dumps({"error": "Invalid image format"}), 
-                    status=400,
-                    content_type='application/json'
-                )
-            
-            # Convert to RGB for processing (exactly like live_patch_attack.py)
-            frame_rgb = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
-            
-            # Create a separate copy for YOLO model processing with brightness adjustments
-            model_frame_rgb = frame_rgb.copy()
-            
-            # Apply brightness adjustments only to the model processing frame
-            gray = cv2.cvtColor(model_frame_rgb, cv2.COLOR_RGB2GRAY)
-            if np.mean(gray) > 100:  # Bright lighting detected
-                # Reduce brightness and enhance contrast
-                model_frame_rgb = cv2.convertScaleAbs(model_frame_rgb, alpha=0.7, beta=-30)
-                clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-                lab = cv2.cvtColor(model_frame_rgb, cv2.COLOR_RGB2LAB)
-                lab[:,:,0] = clahe.apply(lab[:,:,0])
-                model_frame_rgb = cv2.cvtColor(lab, cv2.COLOR_LAB2RGB)
-            
-            # Resize to model size (exactly like live_patch_attack.py)
-            img_t = self.to_tensor(self.resize640(Image.fromarray(model_frame_rgb))).to(self.device)
-            np_640 = self.tensor_to_uint8(img_t)
-            
-            # Run YOLO inference (exactly like live_patch_attack.py MODE_NONE)
-            res = self.model.predict(
-                source=np_640,
-                imgsz=self.img_size,
-                conf=self.conf_base,  # 0.65
-                iou=0.30,  # iou_nms for MODE_NONE
-                augment=False,  # use_tta for MODE_NONE
-                agnostic_nms=False,  # agn_nms for MODE_NONE
-                classes=[0],
-                device=self.device,
-                verbose=False
-            )[0]
-            
-            # Process results
-            detections = []
-            if res.boxes is not None and len(res.boxes) > 0:
-                for box in res.boxes:
-                    detections.append({
-                        "confidence": float(box.conf.item()),
-                        "bbox": {
-                            "x1": float(box.xyxy[0][0].item()),
-                            "y1": float(box.xyxy[0][1].item()),
-                            "x2": float(box.xyxy[0][2].item()),
-                            "y2": float(box.xyxy[0][3].item())
-                        }
-                    })
-            
-            # Calculate average confidence
-            avg_confidence = np.mean([d["confidence"] for d in detections]) if detections else 0.0
-            
-            # Draw results on the original RGB frame
-            frame_rgb_640 = cv2.resize(frame_rgb, (self.img_size, self.img_size))
-            vis = res.plot(img=frame_rgb_640)
-            
-            # Resize back to original resolution
-            original_height, original_width = frame_rgb.shape[:2]
-            vis_resized = cv2.resize(vis, (original_width, original_height))
-            
-            # Convert to BGR for encoding
-            vis_bgr = cv2.cvtColor(vis_resized, cv2.COLOR_RGB2BGR)
-            
-            # Encode as JPEG and convert to base64
-            encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), 85]
-            _, buffer = cv2.imencode('.jpg', vis_bgr, encode_param)
-            frame_b64 = base64.b64encode(buffer).decode('utf-8')
-            
-            # Return results
-            return web.Response(
-                text=json.dumps({
-                    "success": True,
-                    "detections": detections,
-                    "confidence": avg_confidence,
-                    "detection_count": len(detections),
-                    "annotated_image": frame_b64,
-                    "format": "jpeg"
-                }),
-                content_type='application/json'
+            # JSON with a base64 image, or the raw image bytes, read after the shed check
+            status, payload, headers = await self.admitted_inference(
+                lambda: self.read_upload(request), deadline
             )
-            
+            return self.respond(request, payload, status=status, headers=headers)
         except Exception as e:
             logger.error(f"Error in inference: {e}")
-            return web.Response(
-                text=json.dumps({"error": str(e)}), 
-                status=500,
-                content_type='application/json'
-            )
+            return self.respond(request, {"error": str(e)}, status=500)
+
+    async def admitted_inference(self, read_image, deadline=None, annotate=True):
+        """Run one inference under admission control, shared by /inference and /ws.
+
+        read_image is awaited before a worker slot is taken, so a slow upload
+        only holds a queue place, and returns (image_data, is_base64).
+        Returns (status, payload, headers).
+        """
+        # Shed immediately when every worker and queue slot is taken
+        if self.inference_inflight + self.inference_waiting >= self.max_inflight + self.max_queue:
+            self.inference_shed += 1
+            return 503, {"error": "Server overloaded, try again later"}, {
+                "Retry-After": str(self.retry_after_seconds())
+            }
+
+        self.inference_waiting += 1
+        try:
+            # Receive the image first; the upload time counts against the deadline
+            try:
+                image_data, is_base64 = await asyncio.wait_for(read_image(), self.remaining(deadline))
+            except UploadTooLarge:
+                return 413, {"error": "Upload too large"}, None
+            except InvalidUpload as e:
+                return 400, {"error": str(e)}, None
+            except asyncio.TimeoutError:
+                self.inference_expired += 1
+                return 504, {"error": "Deadline exceeded while receiving the image"}, None
+
+            if not image_data:
+                return 400, {"error": "No image provided"}, None
+
+            # Wait for a worker, but no longer than the client is willing to
+            try:
+                await asyncio.wait_for(self.inference_slots.acquire(), self.remaining(deadline))
+            except asyncio.TimeoutError:
+                self.inference_expired += 1
+                return 504, {"error": "Deadline exceeded while queued"}, None
+        finally:
+            self.inference_waiting -= 1
+
+        try:
+            # Drop requests that cannot finish in time before spending CPU on them
+            if deadline is not None and time.monotonic() + self.inference_latency_ewma > deadline:
+                self.inference_expired += 1
+                return 504, {"error": "Deadline exceeded before inference"}, None
+
+            self.inference_inflight += 1
+            try:
+                started = time.monotonic()
+                loop = asyncio.get_running_loop()
+                status, payload = await loop.run_in_executor(
+                    self.inference_executor, self.run_inference, image_data, is_base64, annotate
+                )
+                elapsed = time.monotonic() - started
+                self.inference_latency_ewma += 0.2 * (elapsed - self.inference_latency_ewma)
+                self.inference_completed += 1
+                return status, payload, None
+            finally:
+                self.inference_inflight -= 1
+        finally:
+            self.inference_slots.release()
+
+    def run_inference(self, image_data, is_base64=True, annotate=True):
+        """Decode, detect and annotate one image. Runs in the inference worker thread."""
+        if is_base64:
+            try:
+                image_data = base64.b64decode(image_data, validate=True)
+            except (TypeError, ValueError):
+                return 400, {"error": "Invalid base64 image"}
+            if not image_data:
+                return 400, {"error": "Invalid base64 image"}
+
+        # Large photos are decoded at 1/2, 1/4 or 1/8 scale straight from the JPEG
+        frame_bgr, orig_size = preprocess.decode_image(image_data)
+
+        if frame_bgr is None:
+            return 400, {"error": "Invalid image format"}
+        orig_w, orig_h = orig_size
+
+        # Convert to RGB for processing (exactly like live_patch_attack.py)
+        frame_rgb = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
+
+        # Brightness-adjusted, letterboxed model input (e.g. 640x384 for 16:9 sources)
+        model_input, shape = preprocess.model_input(frame_rgb)
+
+        # Run YOLO inference (exactly like live_patch_attack.py MODE_NONE)
+        res = self.worker_model().predict(
+            source=model_input,
+            imgsz=[shape.input_h, shape.input_w],
+            conf=self.conf_base,  # 0.65
+            iou=0.30,  # iou_nms for MODE_NONE
+            augment=False,  # use_tta for MODE_NONE
+            agnostic_nms=False,  # agn_nms for MODE_NONE
+            classes=[0],
+            device=self.device,
+            verbose=False
+        )[0]
+
+        # Process results, boxes in original image pixels
+        detections = []
+        if res.boxes is not None and len(res.boxes) > 0:
+            xyxy = preprocess.boxes_to_source(res.boxes.xyxy.cpu().numpy(), shape)
+            # From the (possibly reduced) decoded frame to the uploaded image's pixels
+            xyxy *= np.array([orig_w / shape.width, orig_h / shape.height] * 2, dtype=np.float32)
+            for conf, (x1, y1, x2, y2) in zip(res.boxes.conf.cpu().numpy(), xyxy):
+                detections.append({
+                    "confidence": float(conf),
+                    "bbox": {
+                        "x1": float(x1),
+                        "y1": float(y1),
+                        "x2": float(x2),
+                        "y2": float(y2)
+                    }
+                })
+
+        # Calculate average confidence
+        avg_confidence = np.mean([d["confidence"] for d in detections]) if detections else 0.0
+
+        result = {
+            "success": True,
+            "detections": detections,
+            "confidence": avg_confidence,
+            "detection_count": len(detections)
+        }
+        if not annotate:
+            return 200, result
+
+        # Draw results on the letterboxed frame, then back to decoded resolution
+        vis = res.plot(img=preprocess.letterbox(frame_rgb, shape))
+        vis_resized = preprocess.unletterbox(vis, shape)
+
+        # Convert to BGR for encoding
+        vis_bgr = cv2.cvtColor(vis_resized, cv2.COLOR_RGB2BGR)
+
+        # Encode as JPEG (sent as base64 in JSON, raw bytes in MessagePack)
+        encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), 85]
+        _, buffer = cv2.imencode('.jpg', vis_bgr, encode_param)
+
+        # Return results
+        result["annotated_image"] = buffer.tobytes()
+        result["format"] = "jpeg"
+        return 200, result
     
     async def serve_client(self, request):
         """Serve the test client HTML page"""
@@ -386,9 +722,13 @@ class SimpleWebRTCServer:
         </div>
     </div>
 
+    <!-- MessagePack decoder, used when the page is opened with ?format=msgpack -->
+    <script src="https://unpkg.com/@msgpack/msgpack@2.8.0/dist.es5+umd/msgpack.min.js"></script>
     <script>
         let ws = null;
         let isConnected = false;
+        let frameUrl = null;
+        const useMsgpack = new URLSearchParams(window.location.search).get('format') === 'msgpack';
         
         function updateStatus(connected) {
             const status = document.getElementById('status');
@@ -407,7 +747,10 @@ class SimpleWebRTCServer:
             if (ws && ws.readyState === WebSocket.OPEN) return;
             
             console.log('Connecting to WebRTC server...');
-            ws = new WebSocket('ws://localhost:8080/ws');
+            ws = useMsgpack
+                ? new WebSocket('ws://localhost:8080/ws', ['msgpack'])
+                : new WebSocket('ws://localhost:8080/ws');
+            ws.binaryType = 'arraybuffer';
             
             ws.onopen = function(event) {
                 console.log('Connected to WebRTC server');
@@ -416,7 +759,9 @@ class SimpleWebRTCServer:
             
             ws.onmessage = function(event) {
                 try {
-                    const data = JSON.parse(event.data);
+                    const data = typeof event.data === 'string'
+                        ? JSON.parse(event.data)
+                        : MessagePack.decode(new Uint8Array(event.data));
                     handleMessage(data);
                 } catch (error) {
                     console.error('Error parsing message:', error);
@@ -478,7 +823,14 @@ class SimpleWebRTCServer:
             const noVideo = document.getElementById('noVideo');
             
             if (data.frame) {
-                videoStream.src = 'data:image/jpeg;base64,' + data.frame;
+                if (typeof data.frame === 'string') {
+                    videoStream.src = 'data:image/jpeg;base64,' + data.frame;
+                } else {
+                    // MessagePack delivers the JPEG as raw bytes
+                    if (frameUrl) URL.revokeObjectURL(frameUrl);
+                    frameUrl = URL.createObjectURL(new Blob([data.frame], { type: 'image/jpeg' }));
+                    videoStream.src = frameUrl;
+                }
                 videoStream.style.display = 'block';
                 noVideo.style.display = 'none';
             }
@@ -494,8 +846,11 @@ class SimpleWebRTCServer:
         """
         return web.Response(text=html_content, content_type='text/html')
 
-# Global server instance
-server = SimpleWebRTCServer()
+# Global server instance (YOLO_INT8=dynamic|static, YOLO_CALIB_DIR=<images> for the INT8 model)
+server = SimpleWebRTCServer(
+    quantize=os.environ.get("YOLO_INT8"),
+    calib_dir=os.environ.get("YOLO_CALIB_DIR")
+)
 
 def get_server():
     return server